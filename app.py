@@ -10,9 +10,12 @@ st.set_page_config(page_title="Исторический ВестникЪ", layou
 # --- Импорт основного модуля приложения ---
 # Импортируем модули ПОСЛЕ set_page_config
 try:
-    # Импортируем функцию генерации и переменную для последней ошибки
-    from modules.generator import generate_news, last_error
-    from modules.models import NewsReport
+    # Импортируем функции генерации; ошибки и предупреждения приходят в результате запроса
+    from modules.generator import generate_news, stream_news, GenerationResult
+    from modules.cache import get_news_cache
+    from modules.date_index import CALENDAR_START, CALENDAR_END, DATE_DISPLAY_FORMAT
+    from modules.rag import get_filter_options
+    from modules.telemetry import get_metrics
     # Можно добавить необязательное сообщение об успехе, если нужно для отладки
     # st.sidebar.success("Модули 'generator' и 'models' импортированы.")
 except ImportError as app_import_error:
@@ -28,10 +31,70 @@ except Exception as app_other_error:
      st.stop()
 
 
+def render_article(i, article):
+    """Выводит одну заметку номера."""
+    st.markdown(f"---")
+    st.markdown(f"### {i+1}. {article.headline}")
+    st.markdown(f"**Рубрика:** {article.rubric}")
+    st.markdown(f"*{article.date_location}*")
+    st.write(article.body)
+    st.caption(f"Репортажъ велъ: {article.reporter}")
+
+
+def render_problems(result: GenerationResult):
+    """Выводит предупреждения и ошибки запроса (генератор сам ничего в UI не пишет)."""
+    for warning in result.warnings:
+        st.warning(warning)
+    if result.ok:
+        return
+    if result.error_message:
+        st.error(result.error_message)
+        if result.error is not None and str(result.error) not in result.error_message:
+            st.error(f"Детали последней ошибки: {result.error}")
+        # Если в ошибке был сырой вывод, покажем его для отладки
+        if result.raw_output:
+            st.text_area("Последний сырой ответ от LLM (для отладки):", result.raw_output, height=200)
+    else:
+        st.info("Не удалось сгенерировать новости (возможно, нет данных или событий для этой даты).")
+
+
+def render_trace(trace):
+    """Отладочная панель: тайминги этапов последнего запроса и метрики процесса."""
+    with st.expander("🔧 Отладка: тайминги этапов", expanded=False):
+        duration = trace.duration or 0.0
+        st.caption(f"Исходъ: {trace.outcome}, всего {duration:.3f} с, попытокъ: {trace.attrs.get('attempts', 0)}, "
+                   f"контекстъ: {trace.attrs.get('context_chars', 0)} симв., "
+                   f"сбережено токеновъ: {trace.attrs.get('prompt_tokens_saved', 0)}")
+        if trace.error:
+            st.caption(f"Послѣдняя ошибка: {trace.error}")
+        st.dataframe([span.to_dict() for span in trace.spans])
+        st.code(get_metrics().render_prometheus(), language="text")
+
+
 # --- Основной UI приложения ---
 st.title("📜 Исторический ВестникЪ 📰")
 st.caption("Сочинитель лже-историческихъ вѣстей съ примѣненіемъ Разума Механическаго (LLM).")
 st.caption("Сотворёнъ во время прохожденія курса учебнаго ['Дѣлаемъ свой AI-продуктъ на базѣ ChatGPT или другихъ LLM моделей'](https://stepik.org/course/178846/).")
+# --- Фильтры событий (боковая панель) ---
+# Сужают набор событий до поиска: контекст точнее, промпт короче
+year_range, selected_locations, selected_categories = None, None, None
+with st.sidebar:
+    st.header("Отборъ событій")
+    try:
+        filter_options = get_filter_options()
+    except Exception as filter_error:
+        filter_options = None
+        st.warning(f"Фильтры недоступны: {filter_error}")
+    if filter_options:
+        if filter_options["year_bounds"]:
+            first_year, last_year = filter_options["year_bounds"]
+            chosen_years = st.slider("Годы событій:", min_value=first_year, max_value=last_year, value=(first_year, last_year))
+            # Полный диапазон — то же, что отсутствие фильтра
+            if chosen_years != (first_year, last_year):
+                year_range = chosen_years
+        selected_locations = st.multiselect("Мѣсто:", filter_options["locations"]) or None
+        selected_categories = st.multiselect("Рубрика событій:", filter_options["categories"]) or None
+
 # --- Ввод данных пользователем ---
 col1, col2 = st.columns([1, 2])
 
@@ -40,11 +103,11 @@ with col1:
     selected_date = st.date_input(
         "Выберите дату для выпуска газеты (с 1800 по 1830 годы):",
         value=default_date,
-        min_value=datetime.date(1800, 1, 1), # Ограничим разумно данными базы
-        max_value=datetime.date(1830, 1, 1)
+        min_value=CALENDAR_START, # Ограничим разумно данными базы
+        max_value=CALENDAR_END
     )
     # Формат для отображения и для передачи в функцию генерации
-    selected_date_str = selected_date.strftime("%d %B %Y")
+    selected_date_str = selected_date.strftime(DATE_DISPLAY_FORMAT)
 
     # Опционально: выбор стиля эпохи
     era_options = ["XIX", "XVIII", "XVII", "XX"] # Добавьте нужные
@@ -52,6 +115,13 @@ with col1:
 
     num_articles = st.slider("Количество новостей в сводке:", min_value=1, max_value=5, value=3)
 
+    # Повторные запросы той же даты отдаются из кэша; флажок позволяет получить свежий номер
+    regenerate = st.checkbox("Сверстать заново (не брать изъ архива)", value=False)
+    # В потоковом режиме каждая заметка показывается, как только готова, не дожидаясь всего номера
+    streaming = st.checkbox("Печатать заметки по мѣрѣ готовности", value=True)
+    # Тайминги этапов (поиск, промпт, LLM, разбор) и число токенов — для настройки таймаутов и k
+    show_debug = st.checkbox("Показать тайминги этаповъ (отладка)", value=False)
+
     generate_button = st.button("✨ Сгенерировать ВестникЪ!")
 
 
@@ -62,30 +132,46 @@ with col2:
     if generate_button:
         # Убедимся еще раз, что функция доступна (хотя st.stop() выше должен был предотвратить это)
         if 'generate_news' in globals():
-            with st.spinner(f"⏳ Редакція '{'Хронографъ'.upper()}' готовитъ свѣжій номеръ..."):
-                # Вызов функции генерации
-                news_report: NewsReport = generate_news(
-                    target_date=selected_date_str,
-                    era_style=selected_era,
-                    num_articles=num_articles
-                )
-
-                # Отображение результата
-                if news_report and news_report.articles:
+            if streaming:
+                with st.spinner(f"⏳ Редакція '{'Хронографъ'.upper()}' набираетъ свѣжій номеръ..."):
+                    news_stream = stream_news(
+                        target_date=selected_date_str,
+                        era_style=selected_era,
+                        num_articles=num_articles,
+                        use_cache=not regenerate,
+                        year_range=year_range,
+                        locations=selected_locations,
+                        categories=selected_categories
+                    )
+                    for i, article in enumerate(news_stream):
+                        render_article(i, article)
+                # Итог запроса доступен, когда поток исчерпан
+                result = news_stream.result
+                if result.ok:
                     st.success("📰 Свѣжій номеръ готовъ!")
-                    # Отображение новостей
-                    for i, article in enumerate(news_report.articles):
-                        st.markdown(f"---")
-                        st.markdown(f"### {i+1}. {article.headline}")
-                        st.markdown(f"**Рубрика:** {article.rubric}")
-                        st.markdown(f"*{article.date_location}*")
-                        st.write(article.body)
-                        st.caption(f"Репортажъ велъ: {article.reporter}")
-                # Сообщение, если нет новостей, но и не было ошибки (проверяем last_error)
-                # last_error импортируется из generator.py
-                elif last_error is None:
-                     st.info("Не удалось сгенерировать новости (возможно, нет данных или событий для этой даты).")
-                # Если была ошибка, сообщения st.error/st.warning уже были выведены внутри generate_news
+            else:
+                with st.spinner(f"⏳ Редакція '{'Хронографъ'.upper()}' готовитъ свѣжій номеръ..."):
+                    # Вызов функции генерации: результат запроса свой у каждой сессии
+                    result: GenerationResult = generate_news(
+                        target_date=selected_date_str,
+                        era_style=selected_era,
+                        num_articles=num_articles,
+                        use_cache=not regenerate,
+                        year_range=year_range,
+                        locations=selected_locations,
+                        categories=selected_categories
+                    )
+
+                    # Отображение результата
+                    if result.ok:
+                        st.success("📰 Свѣжій номеръ готовъ!")
+                        # Отображение новостей
+                        for i, article in enumerate(result.articles):
+                            render_article(i, article)
+            # Предупреждения, ошибки или сообщение «нет данных»
+            render_problems(result)
+            if show_debug:
+                render_trace(result.trace)
 
         else:
              # Это сообщение не должно появляться, если st.stop() сработал при ошибке импорта
@@ -98,3 +184,8 @@ with col2:
 # --- Подвал ---
 st.markdown("---")
 st.caption("Создано с использованием LLM и Streamlit.")
+try:
+    cache_stats = get_news_cache().stats()
+    st.caption(f"Архивъ выпусковъ: {cache_stats['size']} номеровъ, попаданий {cache_stats['hits']}, промаховъ {cache_stats['misses']}.")
+except Exception as cache_stats_error:
+    print(f"Не удалось получить статистику кэша: {cache_stats_error}")
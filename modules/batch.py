@@ -0,0 +1,187 @@
+# modules/batch.py
+"""Пакетная генерация выпусков на целый календарь (например, на каждый день 1800–1830 годов).
+
+Запуск: python -m modules.batch --start 1800-01-01 --end 1830-01-01 --eras XIX --output issues.jsonl
+Готовые даты дописываются в JSONL по мере готовности; повторный запуск продолжает с того же места.
+"""
+import argparse
+import datetime
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Iterator, List, Set, Tuple
+
+from . import generator
+from .date_index import CALENDAR_END, CALENDAR_START, DATE_DISPLAY_FORMAT, parse_date
+from .rag import retrieve_events_many
+
+
+class RateLimiter:
+    """Потокобезопасный ограничитель частоты: не больше rate запусков в секунду на все потоки."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next_slot = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def iter_dates(start: datetime.date, end: datetime.date) -> Iterator[datetime.date]:
+    """Перебирает даты от start до end включительно."""
+    day = start
+    while day <= end:
+        yield day
+        day += datetime.timedelta(days=1)
+
+
+def load_completed(output_path: str) -> Set[Tuple[str, str, int]]:
+    """Читает контрольную точку: множество уже готовых (дата, век, число статей)."""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                completed.add((record["date"], record["era"], record["num_articles"]))
+            except (json.JSONDecodeError, KeyError):
+                # Последняя строка могла оборваться при аварийной остановке — просто перегенерируем её
+                continue
+    return completed
+
+
+class CheckpointWriter:
+    """Дописывает готовые выпуски в JSONL; запись каждой строки атомарна относительно других потоков."""
+
+    def __init__(self, output_path: str):
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(output_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+
+    def write(self, record: dict) -> None:
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self) -> None:
+        with self._lock:
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+
+def run_batch(start: datetime.date, end: datetime.date, eras: List[str], output_path: str, num_articles: int = 3,
+              workers: int = 4, rate: float = 2.0, date_window_days=None, use_cache: bool = True) -> dict:
+    """Генерирует выпуски для всех дат диапазона и всех стилей эпохи. Возвращает сводку по прогону."""
+    dates = list(iter_dates(start, end))
+    completed = load_completed(output_path)
+    tasks = [(day, era) for day in dates for era in eras if (day.isoformat(), era, num_articles) not in completed]
+    # Пропущенные — задачи этого прогона, уже записанные в файл (другие записи файла не считаются)
+    skipped = len(dates) * len(eras) - len(tasks)
+    print(f"Пакетная генерация: {len(dates)} дат x {len(eras)} стилей, уже готово {skipped}, осталось {len(tasks)}.")
+    if not tasks:
+        return {"done": 0, "failed": 0, "skipped": skipped, "elapsed": 0.0}
+
+    # 1. Контекст для всех нужных дат — одним проходом по индексу дат
+    t0 = time.perf_counter()
+    pending_dates = sorted({day for day, _ in tasks})
+    docs_per_date = retrieve_events_many([d.isoformat() for d in pending_dates], k=num_articles + 2, window_days=date_window_days)
+    contexts = {day: generator.build_context(docs) for day, docs in zip(pending_dates, docs_per_date) if docs}
+    print(f"Контекст для {len(pending_dates)} дат найден за {time.perf_counter() - t0:.3f} с.")
+
+    # 2. Запросы к LLM — через ограниченный пул потоков с общим ограничителем частоты
+    limiter = RateLimiter(rate)
+    writer = CheckpointWriter(output_path)
+    stats = {"done": 0, "failed": 0, "skipped": skipped}
+    stats_lock = threading.Lock()
+    started = time.perf_counter()
+
+    def work(day: datetime.date, era: str) -> bool:
+        context = contexts.get(day)
+        if context is None:
+            return False
+        limiter.wait()
+        result = generator.generate_news_with_context(
+            day.strftime(DATE_DISPLAY_FORMAT), context, era_style=era, num_articles=num_articles, use_cache=use_cache
+        )
+        if not result.ok:
+            if result.error_message:
+                print(f"{day.isoformat()} ({era}): {result.error_message}")
+            return False
+        # Частично восстановленный выпуск не записываем: при возобновлении прогона он будет сгенерирован заново
+        if not result.complete:
+            print(f"{day.isoformat()} ({era}): не хватает статей — {result.missing_articles}, выпуск не сохранён.")
+            return False
+        writer.write({
+            "date": day.isoformat(),
+            "era": era,
+            "num_articles": num_articles,
+            "report": result.report.model_dump(),
+        })
+        return True
+
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(work, day, era) for day, era in tasks]
+            for future in as_completed(futures):
+                try:
+                    ok = future.result()
+                except Exception as e:
+                    print(f"Ошибка в задаче пакетной генерации: {e}")
+                    ok = False
+                with stats_lock:
+                    stats["done" if ok else "failed"] += 1
+                    processed = stats["done"] + stats["failed"]
+                if processed % 25 == 0 or processed == len(tasks):
+                    elapsed = time.perf_counter() - started
+                    throughput = processed / elapsed if elapsed else 0.0
+                    eta = (len(tasks) - processed) / throughput if throughput else float("inf")
+                    print(f"[{processed}/{len(tasks)}] готово {stats['done']}, ошибок {stats['failed']}, "
+                          f"{throughput:.2f} выпусков/с, осталось ~{eta:.0f} с")
+    finally:
+        writer.close()
+
+    stats["elapsed"] = time.perf_counter() - started
+    print(f"Пакетная генерация завершена за {stats['elapsed']:.1f} с: готово {stats['done']}, ошибок {stats['failed']}.")
+    return stats
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Пакетная генерация выпусков 'Исторического ВестникЪ' на диапазон дат.")
+    parser.add_argument("--start", default=CALENDAR_START.isoformat(), help="Первая дата (ГГГГ-ММ-ДД).")
+    parser.add_argument("--end", default=CALENDAR_END.isoformat(), help="Последняя дата включительно (ГГГГ-ММ-ДД).")
+    parser.add_argument("--eras", nargs="+", default=["XIX"], help="Стили эпохи, например: XIX XVIII.")
+    parser.add_argument("--num-articles", type=int, default=3)
+    parser.add_argument("--output", default="issues.jsonl", help="JSONL с готовыми выпусками (он же контрольная точка).")
+    parser.add_argument("--workers", type=int, default=4, help="Число параллельных запросов к LLM.")
+    parser.add_argument("--rate", type=float, default=2.0, help="Максимум запросов к LLM в секунду (0 — без ограничения).")
+    parser.add_argument("--window-days", type=int, default=None, help="Окно поиска событий ±N дней.")
+    parser.add_argument("--no-cache", action="store_true", help="Не использовать кэш выпусков.")
+    parser.add_argument("--base-url", default=None, help="Адрес OpenAI-совместимого API (например, локальной заглушки).")
+    args = parser.parse_args(argv)
+
+    start, end = parse_date(args.start), parse_date(args.end)
+    if start is None or end is None or start > end:
+        parser.error("Некорректный диапазон дат.")
+    if args.base_url:
+        generator.configure_llm(base_url=args.base_url)
+
+    run_batch(start, end, args.eras, args.output, num_articles=args.num_articles, workers=args.workers,
+              rate=args.rate, date_window_days=args.window_days, use_cache=not args.no_cache)
+
+
+if __name__ == "__main__":
+    main()
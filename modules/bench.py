@@ -0,0 +1,325 @@
+# modules/bench.py
+"""Офлайн-бенчмарк генерации и поиска без платного API.
+
+ChatOpenAI подменяется детерминированной заглушкой FakeNewsLLM (задержка до первого токена, скорость
+генерации, доля испорченных ответов), после чего generate_news и поиск из rag.py прогоняются
+на разных уровнях параллельности и числе статей. Отчёт: p50/p95 задержки, пропускная способность,
+повторные попытки, ошибки и память.
+
+Запуск: python -m modules.bench --concurrency 1 4 8 --articles 1 3 5 --malformed-rate 0.1 --output bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import datetime
+import io
+import json
+import random
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import PrivateAttr
+
+from . import generator
+from .date_index import CALENDAR_END, CALENDAR_START, DATE_DISPLAY_FORMAT
+from .telemetry import Trace
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Виды испорченных ответов, которые умеет выдавать заглушка
+MALFORMED_KINDS = ("truncated", "fenced", "prose", "invalid_schema")
+# Примерно столько символов в одном токене (для оценки usage и скорости генерации)
+CHARS_PER_TOKEN = 4
+
+
+def canned_report(num_articles: int, salt: int = 0) -> dict:
+    """Правдоподобный ответ LLM: JSON-объект NewsReport с заданным числом статей."""
+    return {"articles": [
+        {
+            "headline": f"Срочная депеша №{salt}-{i + 1}",
+            "date_location": "С.-Петербургъ, 1812 годъ",
+            "body": "Въ столицѣ только и разговоровъ, что о послѣднихъ событіяхъ. " * 6,
+            "rubric": "Внутреннія извѣстія",
+            "reporter": "Нашъ собственный корреспондентъ",
+        }
+        for i in range(num_articles)
+    ]}
+
+
+class FakeNewsLLM(BaseChatModel):
+    """Чат-модель-заглушка: отвечает заготовленным JSON с настраиваемой задержкой и долей испорченных ответов.
+
+    Последовательность ответов детерминирована seed; число статей берётся из пользовательского промпта.
+    """
+
+    ttft: float = 0.3
+    tokens_per_second: float = 400.0
+    malformed_rate: float = 0.0
+    malformed_kinds: tuple = MALFORMED_KINDS
+    seed: int = 0
+    # Виды первых ответов по порядку (None — корректный ответ); дальше — случайно по malformed_rate
+    script: tuple = ()
+
+    _rng: Any = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default=None)
+    _calls: int = PrivateAttr(default=0)
+
+    def model_post_init(self, __context) -> None:
+        super().model_post_init(__context)
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-news-llm"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _next_response(self, messages: List[BaseMessage]) -> str:
+        prompt = "\n".join(str(message.content) for message in messages)
+        match = re.search(r"примерно (\d+)", prompt)
+        num_articles = int(match.group(1)) if match else 3
+        with self._lock:
+            self._calls += 1
+            salt = self._calls
+            if salt <= len(self.script):
+                kind = self.script[salt - 1]
+            else:
+                kind = self._rng.choice(self.malformed_kinds) if self._rng.random() < self.malformed_rate else None
+        text = json.dumps(canned_report(num_articles, salt), ensure_ascii=False)
+        if kind == "truncated":
+            return text[: len(text) * 2 // 3]
+        if kind == "fenced":
+            return f"```json\n{text}\n```"
+        if kind == "prose":
+            return f"Извольте, вот свежий номер:\n{text}\nС почтением, редакция."
+        if kind == "invalid_schema":
+            broken = json.loads(text)
+            for article in broken["articles"]:
+                article.pop("reporter")
+            return json.dumps(broken, ensure_ascii=False)
+        return text
+
+    def _chunks(self, text: str) -> Iterator[str]:
+        step = CHARS_PER_TOKEN * 4
+        for start in range(0, len(text), step):
+            yield text[start:start + step]
+
+    def _chunk_delay(self, piece: str) -> float:
+        return len(piece) / CHARS_PER_TOKEN / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    @staticmethod
+    def _usage(messages: List[BaseMessage], text: str) -> dict:
+        prompt_tokens = sum(len(str(message.content)) for message in messages) // CHARS_PER_TOKEN
+        completion_tokens = len(text) // CHARS_PER_TOKEN
+        return {"input_tokens": prompt_tokens, "output_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> ChatResult:
+        text = self._next_response(messages)
+        time.sleep(self.ttft + sum(self._chunk_delay(piece) for piece in self._chunks(text)))
+        message = AIMessage(content=text, usage_metadata=self._usage(messages, text))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs) -> Iterator[ChatGenerationChunk]:
+        text = self._next_response(messages)
+        time.sleep(self.ttft)
+        for piece in self._chunks(text):
+            time.sleep(self._chunk_delay(piece))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs):
+        text = self._next_response(messages)
+        await asyncio.sleep(self.ttft)
+        for piece in self._chunks(text):
+            await asyncio.sleep(self._chunk_delay(piece))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=piece))
+        yield ChatGenerationChunk(message=AIMessageChunk(content="", usage_metadata=self._usage(messages, text)))
+
+
+def sample_dates(count: int, seed: int = 0) -> List[str]:
+    """Детерминированная выборка дат календаря в формате интерфейса."""
+    rng = random.Random(seed)
+    span = (CALENDAR_END - CALENDAR_START).days
+    return [(CALENDAR_START + datetime.timedelta(days=rng.randrange(span + 1))).strftime(DATE_DISPLAY_FORMAT) for _ in range(count)]
+
+
+def _percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"p50": float(p50), "p95": float(p95), "max": float(max(values))}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Пиковый RSS процесса в МБ (ru_maxrss в Linux — в КБ, в macOS — в байтах)."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+@contextlib.contextmanager
+def _quiet(verbose: bool):
+    """Прячет отладочные print из generator.py, чтобы не мешать отчёту и не тормозить прогон."""
+    if verbose:
+        yield
+    else:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+
+
+def _run_parallel(func, items, concurrency: int, verbose: bool, trace_memory: bool):
+    """Выполняет func(item) в пуле потоков. Возвращает (результаты, время, пик памяти Python в МБ)."""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    with _quiet(verbose), ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(func, items))
+    elapsed = time.perf_counter() - started
+    heap_peak = None
+    if trace_memory:
+        heap_peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+        tracemalloc.stop()
+    return results, elapsed, heap_peak
+
+
+def bench_generation(dates: List[str], concurrency: int, num_articles: int, verbose: bool = False, trace_memory: bool = False) -> dict:
+    """Прогоняет generate_news по датам (без кэша выпусков) и собирает статистику по трассам."""
+
+    def one(target_date: str) -> Trace:
+        return generator.generate_news(target_date, num_articles=num_articles, use_cache=False).trace
+
+    traces, elapsed, heap_peak = _run_parallel(one, dates, concurrency, verbose, trace_memory)
+    attempts = sum(trace.attrs.get("attempts", 0) for trace in traces)
+    llm_calls = [trace for trace in traces if trace.attrs.get("attempts")]
+    stages = {}
+    for trace in traces:
+        for name, seconds in trace.stage_totals().items():
+            stages.setdefault(name, []).append(seconds)
+    return {
+        "kind": "generate_news",
+        "concurrency": concurrency,
+        "num_articles": num_articles,
+        "requests": len(traces),
+        "ok": sum(trace.outcome == "ok" for trace in traces),
+        "failed": sum(trace.outcome != "ok" for trace in traces),
+        "retries": attempts - len(llm_calls),
+        "latency": _percentiles([trace.duration for trace in traces]),
+        "ttft": _percentiles([span.attrs["ttft"] for trace in traces for span in trace.spans if "ttft" in span.attrs]),
+        "stages_p50": {name: float(np.percentile(values, 50)) for name, values in sorted(stages.items())},
+        "throughput": len(traces) / elapsed if elapsed else None,
+        "elapsed": elapsed,
+        "heap_peak_mb": heap_peak,
+        "rss_peak_mb": _peak_rss_mb(),
+    }
+
+
+def bench_retrieval(dates: List[str], concurrency: int, k: int, semantic: bool = False, verbose: bool = False,
+                    trace_memory: bool = False) -> dict:
+    """Замеряет поиск событий: по индексу дат (retrieve_events) или семантический (semantic_search)."""
+    from .rag import retrieve_events, semantic_search
+
+    search = semantic_search if semantic else retrieve_events
+
+    def one(target_date: str) -> float:
+        started = time.perf_counter()
+        search(target_date, k=k)
+        return time.perf_counter() - started
+
+    with _quiet(verbose):
+        search(dates[0], k=k)  # Прогрев: загрузка индексов не должна попадать в замер
+    latencies, elapsed, heap_peak = _run_parallel(one, dates, concurrency, verbose, trace_memory)
+    return {
+        "kind": "semantic_search" if semantic else "retrieve_events",
+        "concurrency": concurrency,
+        "k": k,
+        "requests": len(latencies),
+        "latency": _percentiles(latencies),
+        "throughput": len(latencies) / elapsed if elapsed else None,
+        "elapsed": elapsed,
+        "heap_peak_mb": heap_peak,
+        "rss_peak_mb": _peak_rss_mb(),
+    }
+
+
+def _ms(value: Optional[float]) -> str:
+    return "—" if value is None else f"{value * 1000:.1f}"
+
+
+def print_report(results: List[dict]) -> None:
+    print(f"{'сценарий':<16} {'пар.':>4} {'стат/k':>6} {'запр.':>6} {'p50, мс':>9} {'p95, мс':>9} {'ttft p50':>9} "
+          f"{'в сек.':>8} {'повт.':>5} {'ошиб.':>5} {'RSS, МБ':>8}")
+    for result in results:
+        ttft = result.get("ttft", {}).get("p50")
+        rss = result.get("rss_peak_mb")
+        print(f"{result['kind']:<16} {result['concurrency']:>4} {result.get('num_articles', result.get('k')):>6} "
+              f"{result['requests']:>6} {_ms(result['latency']['p50']):>9} {_ms(result['latency']['p95']):>9} "
+              f"{_ms(ttft):>9} {result['throughput']:>8.1f} {result.get('retries', 0):>5} {result.get('failed', 0):>5} "
+              f"{'—' if rss is None else f'{rss:.0f}':>8}")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк генерации и поиска с заглушкой LLM.")
+    parser.add_argument("--requests", type=int, default=40, help="Запросов на генерацию в каждом сценарии.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8], help="Уровни параллельности.")
+    parser.add_argument("--articles", type=int, nargs="+", default=[1, 3, 5], help="Число статей в выпуске.")
+    parser.add_argument("--ttft", type=float, default=0.3, help="Задержка заглушки до первого токена, с.")
+    parser.add_argument("--tokens-per-second", type=float, default=400.0, help="Скорость генерации заглушки (0 — мгновенно).")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Доля испорченных ответов (0..1).")
+    parser.add_argument("--malformed-kinds", nargs="+", default=list(MALFORMED_KINDS), choices=MALFORMED_KINDS)
+    parser.add_argument("--backoff", type=float, default=0.0, help="Базовая пауза между попытками, с (в приложении — 2).")
+    parser.add_argument("--retrieval-queries", type=int, default=2000, help="Запросов в сценарии поиска (0 — пропустить).")
+    parser.add_argument("--semantic", action="store_true", help="Также замерить семантический поиск по векторной базе.")
+    parser.add_argument("--trace-memory", action="store_true", help="Считать пик памяти Python через tracemalloc (медленнее).")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="JSON с результатами (для сравнения между версиями).")
+    parser.add_argument("--verbose", action="store_true", help="Не скрывать вывод генератора.")
+    args = parser.parse_args(argv)
+
+    llm = FakeNewsLLM(ttft=args.ttft, tokens_per_second=args.tokens_per_second, malformed_rate=args.malformed_rate,
+                      malformed_kinds=tuple(args.malformed_kinds), seed=args.seed)
+    generator.configure_llm(llm=llm)
+    generator.RETRY_BACKOFF_SECONDS = args.backoff
+
+    results = []
+    if args.retrieval_queries > 0:
+        dates = sample_dates(args.retrieval_queries, args.seed)
+        for concurrency in args.concurrency:
+            results.append(bench_retrieval(dates, concurrency, k=5, verbose=args.verbose, trace_memory=args.trace_memory))
+            if args.semantic:
+                results.append(bench_retrieval(dates, concurrency, k=5, semantic=True, verbose=args.verbose,
+                                               trace_memory=args.trace_memory))
+    dates = sample_dates(args.requests, args.seed)
+    for num_articles in args.articles:
+        for concurrency in args.concurrency:
+            results.append(bench_generation(dates, concurrency, num_articles, verbose=args.verbose, trace_memory=args.trace_memory))
+
+    print_report(results)
+    print(f"Вызовов заглушки LLM: {llm.calls}.")
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "results": results}, f, ensure_ascii=False, indent=2)
+        print(f"Результаты записаны в '{args.output}'.")
+
+
+if __name__ == "__main__":
+    main()
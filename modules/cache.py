@@ -0,0 +1,138 @@
+# modules/cache.py
+import contextlib
+import functools
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Iterator, Optional
+
+from pydantic import ValidationError
+
+from .date_index import parse_date
+from .models import NewsReport
+
+# --- Конфигурация кэша ---
+# Путь к файлу SQLite с готовыми выпусками (переопределяется переменными окружения)
+CACHE_PATH = os.getenv("NEWS_CACHE_PATH", os.path.join(".cache", "news_cache.sqlite3"))
+# Время жизни записи в секундах (по умолчанию неделя) и максимальное число записей
+CACHE_TTL_SECONDS = int(os.getenv("NEWS_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+CACHE_MAX_ENTRIES = int(os.getenv("NEWS_CACHE_MAX_ENTRIES", "5000"))
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def make_cache_key(target_date: str, era_style: str, num_articles: int, context: str, prompt_template: str) -> str:
+    """Ключ кэша: входные параметры + хэш найденного контекста и шаблона промпта."""
+    # Нормализуем дату, чтобы "07 September 1812" и "1812-09-07" попадали в одну запись
+    parsed_date = parse_date(target_date)
+    date_key = parsed_date.isoformat() if parsed_date else str(target_date).strip()
+    payload = {
+        "date": date_key,
+        "era": era_style,
+        "num_articles": num_articles,
+        "context": _sha256(context),
+        "prompt": _sha256(prompt_template),
+    }
+    return _sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False))
+
+
+class NewsCache:
+    """Дисковый кэш провалидированных NewsReport (SQLite) с вытеснением по TTL и размеру."""
+
+    def __init__(self, path: str = CACHE_PATH, ttl_seconds: int = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS news_cache ("
+                " key TEXT PRIMARY KEY,"
+                " report TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Отдельное соединение на операцию: безопасно для нескольких потоков и процессов
+        conn = sqlite3.connect(self.path, timeout=10)
+        try:
+            with conn: # Коммит при успехе, откат при исключении
+                yield conn
+        finally:
+            conn.close()
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def get(self, key: str) -> Optional[NewsReport]:
+        """Возвращает закэшированный отчёт или None (устаревшие и повреждённые записи удаляются)."""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute("SELECT report, created_at FROM news_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._count(hit=False)
+                return None
+            report_json, created_at = row
+            if now - created_at > self.ttl_seconds:
+                conn.execute("DELETE FROM news_cache WHERE key = ?", (key,))
+                self._count(hit=False)
+                return None
+            try:
+                report = NewsReport.model_validate_json(report_json)
+            except ValidationError as e:
+                print(f"Повреждённая запись кэша {key[:12]}... удалена: {e}")
+                conn.execute("DELETE FROM news_cache WHERE key = ?", (key,))
+                self._count(hit=False)
+                return None
+            conn.execute("UPDATE news_cache SET accessed_at = ? WHERE key = ?", (now, key))
+        self._count(hit=True)
+        return report
+
+    def set(self, key: str, report: NewsReport) -> None:
+        """Сохраняет отчёт и вытесняет устаревшие и самые давно использованные записи."""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO news_cache (key, report, created_at, accessed_at) VALUES (?, ?, ?, ?)",
+                (key, report.model_dump_json(), now, now),
+            )
+            conn.execute("DELETE FROM news_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM news_cache WHERE key IN ("
+                " SELECT key FROM news_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        """Удаляет все записи кэша."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM news_cache")
+
+    def stats(self) -> dict:
+        """Счётчики попаданий/промахов и текущий размер кэша."""
+        with self._connect() as conn:
+            (size,) = conn.execute("SELECT COUNT(*) FROM news_cache").fetchone()
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": size}
+
+
+@functools.lru_cache(maxsize=1)
+def get_news_cache() -> NewsCache:
+    """Возвращает общий для процесса экземпляр кэша."""
+    return NewsCache()
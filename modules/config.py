@@ -0,0 +1,45 @@
+# modules/config.py
+"""Секреты и настройки без импорта Streamlit.
+
+Читает те же файлы, что и st.secrets (~/.streamlit/secrets.toml и .streamlit/secrets.toml в папке запуска,
+последний главнее), а если ключа там нет — переменные окружения (.env подхватывается через load_dotenv).
+Так generator.py и rag.py работают одинаково в Streamlit, в HTTP-сервисе и в пакетных задачах.
+"""
+import functools
+import os
+from typing import Optional
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11
+    tomllib = None
+
+SECRETS_FILES = (
+    os.path.join(os.path.expanduser("~"), ".streamlit", "secrets.toml"),
+    os.path.join(".streamlit", "secrets.toml"),
+)
+
+
+@functools.lru_cache(maxsize=1)
+def load_secrets() -> dict:
+    """Читает secrets.toml (глобальный, затем проектный). Отсутствующие или битые файлы пропускаются."""
+    secrets = {}
+    if tomllib is None:
+        return secrets
+    for path in SECRETS_FILES:
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "rb") as f:
+                secrets.update(tomllib.load(f))
+        except (OSError, tomllib.TOMLDecodeError) as e:
+            print(f"Не удалось прочитать секреты из '{path}': {e}")
+    return secrets
+
+
+def get_secret(name: str, default: Optional[str] = None) -> Optional[str]:
+    """Значение секрета: из secrets.toml, иначе из переменной окружения, иначе default (как st.secrets.get(name, os.getenv(...)))."""
+    value = load_secrets().get(name)
+    if value is not None:
+        return value
+    return os.getenv(name, default)
@@ -0,0 +1,143 @@
+# modules/date_index.py
+import datetime
+import re
+from bisect import bisect_left
+from typing import Iterable, List, Optional, Tuple
+
+from langchain_core.documents import Document
+
+# Диапазон дат, доступных для выбора в интерфейсе (app.py) и для пакетной генерации
+CALENDAR_START = datetime.date(1800, 1, 1)
+CALENDAR_END = datetime.date(1830, 1, 1)
+# Формат даты, в котором её видят пользователь и LLM (как в app.py)
+DATE_DISPLAY_FORMAT = "%d %B %Y"
+
+# Форматы дат, которые встречаются в CSV и приходят из интерфейса
+_DATE_FORMATS = ("%Y-%m-%d", "%d %B %Y", "%d %b %Y", "%d.%m.%Y", "%Y")
+
+# Названия месяцев по-русски (основы слов, чтобы покрыть "июль"/"июля"/"Июля")
+_RU_MONTHS = {
+    "январ": 1, "феврал": 2, "март": 3, "апрел": 4, "ма": 5, "июн": 6,
+    "июл": 7, "август": 8, "сентябр": 9, "октябр": 10, "ноябр": 11, "декабр": 12,
+}
+_RU_DATE_RE = re.compile(r"^(\d{1,2})\s+([а-яё]+)\s+(\d{3,4})", re.IGNORECASE)
+
+
+def parse_date(value) -> Optional[datetime.date]:
+    """Разбирает дату из строки (ISO, '%d %B %Y', '14 июля 1789', только год). Возвращает None, если не вышло."""
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    text = str(value).strip()
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+
+    match = _RU_DATE_RE.match(text)
+    if match:
+        day, month_word, year = match.groups()
+        month_word = month_word.lower()
+        # Ищем самую длинную подходящую основу ("ма" не должна перехватить "март")
+        for stem in sorted(_RU_MONTHS, key=len, reverse=True):
+            if month_word.startswith(stem):
+                try:
+                    return datetime.date(int(year), _RU_MONTHS[stem], int(day))
+                except ValueError:
+                    return None
+    return None
+
+
+class DateIndex:
+    """Отсортированный по дате индекс событий: поиск ближайших к дате событий бинарным поиском, без эмбеддингов."""
+
+    def __init__(self, documents: Iterable[Document]):
+        entries = []
+        skipped = 0
+        for doc in documents:
+            event_date = parse_date(doc.metadata.get("date", ""))
+            if event_date is None:
+                skipped += 1
+                continue
+            entries.append((event_date.toordinal(), doc))
+        # Стабильная сортировка сохраняет исходный порядок событий одного дня
+        entries.sort(key=lambda entry: entry[0])
+        self._ordinals = [ordinal for ordinal, _ in entries]
+        self._documents = [doc for _, doc in entries]
+        if skipped:
+            print(f"DateIndex: пропущено {skipped} документов без корректной даты в метаданных.")
+
+    @classmethod
+    def from_vector_store(cls, vector_store) -> "DateIndex":
+        """Строит индекс по metadata['date'] документов, уже сохранённых в index.pkl (или в хранилище memory-map)."""
+        if hasattr(vector_store, "documents"):
+            return cls(vector_store.documents)
+        docstore = vector_store.docstore
+        documents = [docstore.search(doc_id) for doc_id in vector_store.index_to_docstore_id.values()]
+        return cls(doc for doc in documents if isinstance(doc, Document))
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    @property
+    def documents(self) -> List[Document]:
+        """Документы в порядке возрастания даты; позиция в списке служит id документа в индексе."""
+        return self._documents
+
+    def _expand(self, t: int, hi: int, k: int, window_days: Optional[int], allowed=None) -> List[Tuple[int, int]]:
+        """Расходится от точки вставки hi: lo идёт в прошлое, hi — в будущее. Возвращает (позиция, расстояние).
+
+        allowed — необязательное множество позиций (например, из MetadataIndex); остальные пропускаются.
+        """
+        lo = hi - 1
+        n = len(self._ordinals)
+        found = []
+        while len(found) < k:
+            lo_dist = t - self._ordinals[lo] if lo >= 0 else None
+            hi_dist = self._ordinals[hi] - t if hi < n else None
+            if lo_dist is None and hi_dist is None:
+                break
+            if hi_dist is not None and (lo_dist is None or hi_dist <= lo_dist):
+                position, distance = hi, hi_dist
+                hi += 1
+            else:
+                position, distance = lo, lo_dist
+                lo -= 1
+            # Кандидаты идут по возрастанию расстояния, дальше окна искать нечего
+            if window_days is not None and distance > window_days:
+                break
+            if allowed is None or position in allowed:
+                found.append((position, distance))
+        return found
+
+    def search_with_distance(self, target_date, k: int = 5, window_days: Optional[int] = None, allowed=None) -> List[Tuple[Document, int]]:
+        """Возвращает до k событий, ближайших к дате, вместе с расстоянием в днях (опционально в окне ±window_days)."""
+        target = parse_date(target_date)
+        if target is None:
+            raise ValueError(f"Не удалось распознать дату: '{target_date}'")
+        t = target.toordinal()
+        found = self._expand(t, bisect_left(self._ordinals, t), k, window_days, allowed)
+        return [(self._documents[position], distance) for position, distance in found]
+
+    def positions_many(self, target_dates, k: int = 5, window_days: Optional[int] = None, allowed=None) -> List[List[Tuple[int, int]]]:
+        """Для многих дат за один проход по отсортированным запросам возвращает (позиция, расстояние в днях)."""
+        parsed = [parse_date(value) for value in target_dates]
+        results: List[List[Tuple[int, int]]] = [[] for _ in parsed]
+        order = sorted((d.toordinal(), i) for i, d in enumerate(parsed) if d is not None)
+        start = 0
+        for t, i in order:
+            # Запросы отсортированы, поэтому точка вставки только растёт: бинарный поиск идёт с прошлой позиции
+            start = bisect_left(self._ordinals, t, start)
+            results[i] = self._expand(t, start, k, window_days, allowed)
+        return results
+
+    def search_many(self, target_dates, k: int = 5, window_days: Optional[int] = None, allowed=None) -> List[List[Document]]:
+        """Ищет ближайшие события сразу для многих дат за один проход по отсортированным запросам."""
+        found_per_date = self.positions_many(target_dates, k=k, window_days=window_days, allowed=allowed)
+        return [[self._documents[position] for position, _ in found] for found in found_per_date]
+
+    def search(self, target_date, k: int = 5, window_days: Optional[int] = None, allowed=None) -> List[Document]:
+        """Возвращает до k событий, ближайших к дате (опционально в окне ±window_days и среди позиций allowed)."""
+        return [doc for doc, _ in self.search_with_distance(target_date, k=k, window_days=window_days, allowed=allowed)]
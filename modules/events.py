@@ -0,0 +1,48 @@
+# modules/events.py
+import csv
+import os
+from typing import Dict, Iterator, List
+
+from langchain_core.documents import Document
+
+# --- Константы ---
+# Путь к CSV с историческими событиями (относительно корня проекта)
+CSV_FILE_PATH = os.path.join("data", "historical_events.csv")
+
+
+def row_to_document(row: Dict[str, str], source: str) -> Document:
+    """Преобразует строку CSV в документ LangChain (тот же формат, что и в create_vector_db.ipynb)."""
+    location = (row.get("location") or "").strip()
+    category = (row.get("category") or "").strip()
+
+    content = f"Дата: {row['date']}. Событие: {row['event_description']}"
+    if location:
+        content += f". Место: {location}"
+    if category:
+        content += f". Категория: {category}"
+
+    metadata = {"date": str(row["date"]), "source": source}
+    if location:
+        metadata["location"] = location
+    if category:
+        metadata["category"] = category
+    return Document(page_content=content, metadata=metadata)
+
+
+def iter_event_rows(file_path: str = CSV_FILE_PATH) -> Iterator[Dict[str, str]]:
+    """Построчно читает CSV с событиями, не загружая весь файл в память."""
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Файл данных не найден: {file_path}")
+    with open(file_path, encoding="utf-8", newline="") as f:
+        for row in csv.DictReader(f):
+            if row.get("date") and row.get("event_description"):
+                yield row
+
+
+def load_documents_from_csv(file_path: str = CSV_FILE_PATH) -> List[Document]:
+    """Загружает события из CSV и преобразует их в документы LangChain."""
+    # В метаданных индекса хранится только имя файла, сохраняем этот формат
+    source = os.path.basename(file_path)
+    documents = [row_to_document(row, source) for row in iter_event_rows(file_path)]
+    print(f"Загружено {len(documents)} документов из {file_path}")
+    return documents
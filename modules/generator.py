@@ -1,82 +1,151 @@
 # modules/generator.py
-import streamlit as st
+import asyncio
+import functools
 import os
 import time
-import json
-import re
+import weakref
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+import httpx
 from dotenv import load_dotenv
 
 # Импорты LangChain
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.output_parsers import PydanticOutputParser, StrOutputParser
 # Импортируем САМ МОДУЛЬ exceptions из langchain_core
 from langchain_core import exceptions
 from langchain_core.runnables import RunnablePassthrough
-# Импортируем Pydantic ValidationError отдельно для ручного парсинга
-from pydantic import ValidationError
 
 
 # Импорты вашего проекта
+from .cache import get_news_cache, make_cache_key
+from .config import get_secret
 from .models import NewsReport
-from .rag import get_retriever
+from .parsing import ArticleStreamParser, salvage_articles
+from .prompt_budget import build_budgeted_context, compact_format_instructions, schema_tokens_saved
+from .rag import retrieve_events
+from .telemetry import Trace
 
 load_dotenv()
 
 # --- Конфигурация API ---
-# Используем ваш FORGETAPI_KEY и BASE_URL из секретов Streamlit или .env
-API_KEY = st.secrets.get("FORGETAPI_KEY", os.getenv("FORGETAPI_KEY"))
-BASE_URL = st.secrets.get("FORGETAPI_BASE_URL", os.getenv("FORGETAPI_BASE_URL", "https://forgetapi.ru/v1")) # Укажите URL по умолчанию, если нужно
+# Используем ваш FORGETAPI_KEY и BASE_URL из секретов Streamlit (.streamlit/secrets.toml) или .env;
+# Streamlit при этом не импортируется, так что модуль работает и в HTTP-сервисе, и в пакетных задачах
+API_KEY = get_secret("FORGETAPI_KEY")
+BASE_URL = get_secret("FORGETAPI_BASE_URL", "https://forgetapi.ru/v1") # Укажите URL по умолчанию, если нужно
 MAX_RETRIES = 2
-# Глобальная переменная для хранения последней ошибки (для app.py)
-last_error = None
+RETRY_BACKOFF_SECONDS = 2 # Базовая пауза между попытками, удваивается с каждой попыткой
+# Максимум одновременных запросов к LLM из асинхронного API (agenerate_news)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MODEL = "gpt-4o" # Или другая модель, доступная через ваш BASE_URL
+LLM_REQUEST_TIMEOUT = 120 # Увеличьте, если запросы часто прерываются по таймауту
+# Размер пула keep-alive соединений к API, общего для всех сессий процесса
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+# Просить у API число токенов в потоковом ответе (выключите, если прокси не поддерживает stream_options)
+LLM_STREAM_USAGE = os.getenv("LLM_STREAM_USAGE", "1") != "0"
+# Описание формата ответа в промпте: "compact" — короткий образец JSON, "full" — полная JSON-схема PydanticOutputParser
+PROMPT_SCHEMA = os.getenv("PROMPT_SCHEMA", "compact")
+# --- Шаблоны промпта ---
+# Вынесены в константы: их хэш входит в ключ кэша, и правка промпта не отдаст старые выпуски
+SYSTEM_PROMPT = """Ты — остроумный и немного саркастичный редактор исторической газеты 'Хронографъ'.
+Твоя задача — написать сводку новостей для выпуска газеты на заданную дату.
+Используй следующие реальные исторические события как основу, но добавь детали, юмор, вымышленных персонажей или комментарии в стиле газеты {era_style} века.
+
+ВАЖНО: Весь твой ответ ДОЛЖЕН быть ТОЛЬКО JSON объектом, без какого-либо другого текста до или после него.
+JSON должен строго соответствовать следующей структуре (не включай ```json или ``` в свой ответ):
+{format_instructions}
+
+Реальные события (контекст):
+{context}"""
+USER_PROMPT = "Пожалуйста, напиши новости для даты {date_input}. Используй примерно {num_articles} события из контекста. Стиль: {era_style} век."
+# Всё, что влияет на ответ LLM помимо входных параметров, — для ключа кэша
+PROMPT_TEMPLATE_ID = "\n".join([LLM_MODEL, SYSTEM_PROMPT, USER_PROMPT, PROMPT_SCHEMA])
+
+# Готовая модель вместо ChatOpenAI (например, заглушка из modules.bench); None — обычный клиент API
+_llm_override = None
+
+def configure_llm(api_key=None, base_url=None, llm=None) -> None:
+    """Переопределяет ключ и адрес API (например, для локального сервера-заглушки) и сбрасывает кэш клиентов.
+
+    llm — готовая чат-модель LangChain, которая будет использоваться вместо ChatOpenAI.
+    """
+    global API_KEY, BASE_URL, _llm_override
+    if api_key is not None:
+        API_KEY = api_key
+    if base_url is not None:
+        BASE_URL = base_url
+    if llm is not None:
+        _llm_override = llm
+    get_shared_llm.cache_clear()
+    get_generation_chain.cache_clear()
+    get_streaming_chain.cache_clear()
+    _async_chains.clear()
 
 # --- Функция get_llm ---
 def get_llm():
     """Инициализирует LLM с заданными параметрами."""
+    if _llm_override is not None:
+        return _llm_override
     if not API_KEY:
-        # Используем st.error для отображения в UI Streamlit, если ключ не найден при запуске
-        st.error("Критическая ошибка: Не найден API ключ для 'forgetapi'. Добавьте FORGETAPI_KEY в секреты Streamlit или в .env файл.")
-        # Выбрасываем ValueError, чтобы остановить выполнение, если ключ абсолютно необходим
-        raise ValueError("FORGETAPI_KEY не найден.")
+        # Выбрасываем ValueError: вызывающий код покажет сообщение в UI или запишет его в лог
+        raise ValueError("Не найден API ключ для 'forgetapi'. Добавьте FORGETAPI_KEY в секреты Streamlit или в .env файл.")
     if not BASE_URL:
         # Аналогично для BASE_URL
-        st.error("Критическая ошибка: Не найден BASE_URL для 'forgetapi'. Добавьте FORGETAPI_BASE_URL в секреты Streamlit или в .env файл.")
-        raise ValueError("FORGETAPI_BASE_URL не найден.")
+        raise ValueError("Не найден BASE_URL для 'forgetapi'. Добавьте FORGETAPI_BASE_URL в секреты Streamlit или в .env файл.")
 
+    # Явные HTTP-клиенты с пулом keep-alive соединений: TLS-рукопожатие не повторяется на каждый запрос
+    limits = httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
     llm = ChatOpenAI(
-        model="gpt-4o", # Или другая модель, доступная через ваш BASE_URL
+        model=LLM_MODEL,
         openai_api_key=API_KEY,
         openai_api_base=BASE_URL,
         temperature=0.7,
-        request_timeout=120 # Увеличьте, если запросы часто прерываются по таймауту
+        request_timeout=LLM_REQUEST_TIMEOUT,
+        stream_usage=LLM_STREAM_USAGE, # Токены промпта/ответа приходят в последнем фрагменте потока
+        http_client=httpx.Client(limits=limits, timeout=LLM_REQUEST_TIMEOUT),
+        http_async_client=httpx.AsyncClient(limits=limits, timeout=LLM_REQUEST_TIMEOUT)
     )
     return llm
 
-# --- Функция create_generation_chain ---
-def create_generation_chain():
-    """Создает LangChain цепочку для генерации структурированных новостей."""
-    llm = get_llm() # Получаем настроенный LLM
-    # Создаем парсер на основе Pydantic модели NewsReport
-    pydantic_parser = PydanticOutputParser(pydantic_object=NewsReport)
-    # Получаем инструкции по форматированию для LLM
-    format_instructions = pydantic_parser.get_format_instructions()
+# --- Парсер и инструкции по форматированию (создаются один раз на процесс) ---
+@functools.lru_cache(maxsize=1)
+def get_output_parser() -> PydanticOutputParser:
+    """Возвращает общий Pydantic-парсер для NewsReport."""
+    return PydanticOutputParser(pydantic_object=NewsReport)
 
-    # Определяем шаблон промпта с инструкциями и плейсхолдерами
-    prompt = ChatPromptTemplate.from_messages([
-         ("system", """Ты — остроумный и немного саркастичный редактор исторической газеты 'Хронографъ'.
-Твоя задача — написать сводку новостей для выпуска газеты на заданную дату.
-Используй следующие реальные исторические события как основу, но добавь детали, юмор, вымышленных персонажей или комментарии в стиле газеты {era_style} века.
+@functools.lru_cache(maxsize=1)
+def get_format_instructions() -> str:
+    """Возвращает инструкции по форматированию JSON (схема NewsReport не меняется в рантайме)."""
+    if PROMPT_SCHEMA == "full":
+        return get_output_parser().get_format_instructions()
+    return compact_format_instructions(NewsReport)
 
-ВАЖНО: Весь твой ответ ДОЛЖЕН быть ТОЛЬКО JSON объектом, без какого-либо другого текста до или после него.
-JSON должен строго соответствовать следующей структуре (не включай ```json или ``` в свой ответ):
-{format_instructions}
+def _schema_tokens_saved() -> int:
+    """Токены, которые компактная схема экономит в каждом запросе к LLM (по сравнению с полной)."""
+    return schema_tokens_saved(get_output_parser().get_format_instructions(), get_format_instructions())
 
-Реальные события (контекст):
-{context}"""),
+@functools.lru_cache(maxsize=1)
+def get_shared_llm():
+    """Возвращает LLM, общий для всех цепочек процесса (один клиент и один пул соединений)."""
+    return get_llm()
+
+def create_prompt() -> ChatPromptTemplate:
+    """Создает шаблон промпта с уже подставленными инструкциями по форматированию."""
+    # Определяем шаблон промпта с инструкциями и плейсхолдерами
+    return ChatPromptTemplate.from_messages([
+        ("system", SYSTEM_PROMPT),
         # Пользовательский запрос с параметрами
-        ("user", "Пожалуйста, напиши новости для даты {date_input}. Используй примерно {num_articles} события из контекста. Стиль: {era_style} век.")
-    ])
+        ("user", USER_PROMPT)
+    ]).partial(format_instructions=get_format_instructions()) # Инструкции подставляются в шаблон один раз
+
+# --- Функция create_generation_chain ---
+def create_generation_chain(llm=None):
+    """Создает LangChain цепочку для генерации структурированных новостей (по умолчанию — на общем LLM)."""
+    llm = llm if llm is not None else get_shared_llm() # Получаем настроенный LLM
+    # Парсер берём из общего кэша
+    pydantic_parser = get_output_parser()
+    prompt = create_prompt()
 
     # Создаем цепочку: Промпт -> LLM -> Парсер Pydantic
     # Парсер автоматически попытается разобрать вывод LLM в объект NewsReport
@@ -85,115 +154,686 @@ JSON должен строго соответствовать следующей
     # chain = prompt | llm | RunnablePassthrough(lambda x: print(f"--- LLM Raw Output ---\n{x.content}\n---")) | pydantic_parser
     return chain
 
-# --- Функция generate_news ---
-def generate_news(target_date: str, era_style: str = "XIX", num_articles: int = 3) -> NewsReport:
-    """Основная функция для генерации новостей с обработкой ошибок и повторными попытками."""
-    global last_error # Объявляем, что будем менять глобальную переменную
-    last_error = None # Сбрасываем ошибку перед каждым новым запуском
-    print(f"Запрос на генерацию новостей для даты: {target_date}, стиль: {era_style}")
+@functools.lru_cache(maxsize=1)
+def get_generation_chain():
+    """Возвращает цепочку генерации, общую для всех запросов процесса.
+
+    Клиент ChatOpenAI и его пул соединений переиспользуются параллельными сессиями.
+    Ошибка конфигурации (нет ключа) не кэшируется: следующий вызов попробует снова.
+    """
+    return create_generation_chain()
+
+@functools.lru_cache(maxsize=1)
+def get_streaming_chain():
+    """Возвращает цепочку для потоковой генерации: тот же промпт и LLM, но ответ отдаётся сырым текстом.
+
+    PydanticOutputParser не умеет разбирать неполный JSON, поэтому статьи из потока
+    выделяет ArticleStreamParser.
+    """
+    return create_prompt() | get_shared_llm() | StrOutputParser()
+
+# --- Результат запроса ---
+@dataclass
+class GenerationResult:
+    """Итог одного запроса на генерацию: выпуск, ошибка, предупреждения и трасса этапов.
+
+    Создаётся на каждый вызов, поэтому параллельные запросы (потоки, asyncio, сессии Streamlit)
+    не делят общего состояния. Показывать ошибки и предупреждения — дело вызывающего кода.
+    """
+    report: NewsReport = field(default_factory=lambda: NewsReport(articles=[]))
+    error: Optional[BaseException] = None # Последняя ошибка (у ошибок парсинга в llm_output — сырой ответ)
+    error_message: Optional[str] = None # Сообщение об ошибке для пользователя
+    warnings: List[str] = field(default_factory=list)
+    trace: Trace = field(default_factory=Trace)
+
+    @property
+    def ok(self) -> bool:
+        return bool(self.report.articles)
+
+    @property
+    def articles(self):
+        return self.report.articles
+
+    @property
+    def attempts(self) -> int:
+        return self.trace.attrs.get("attempts", 0)
 
-    # 1. Получаем контекст из RAG
+    @property
+    def missing_articles(self) -> int:
+        """Сколько статей не удалось восстановить из оборванного ответа (выпуск восстановлен лишь частично)."""
+        return self.trace.attrs.get("missing_articles", 0)
+
+    @property
+    def complete(self) -> bool:
+        """Выпуск готов и не обрезан: ответ LLM цел или полностью восстановлен."""
+        return self.ok and not self.missing_articles
+
+    @property
+    def cache_hit(self) -> bool:
+        return bool(self.trace.attrs.get("cache_hit"))
+
+    @property
+    def repaired(self) -> bool:
+        return bool(self.trace.attrs.get("repaired"))
+
+    @property
+    def timings(self) -> Dict[str, float]:
+        """Суммарное время по этапам, с."""
+        return self.trace.stage_totals()
+
+    @property
+    def tokens_saved(self) -> int:
+        """Входные токены, сэкономленные бюджетом промпта (сумма по всем запросам к LLM)."""
+        return self.trace.attrs.get("prompt_tokens_saved", 0)
+
+    @property
+    def raw_output(self) -> Optional[str]:
+        raw_output = getattr(self.error, "llm_output", None)
+        return str(raw_output) if raw_output else None
+
+    def fail(self, message: str, error: BaseException) -> None:
+        self.error_message = message
+        self.error = error
+
+    def clear_error(self) -> None:
+        self.error = None
+        self.error_message = None
+
+    def to_dict(self) -> dict:
+        """JSON-совместимое представление (для HTTP-сервиса и журналов)."""
+        return {
+            "ok": self.ok,
+            "report": self.report.model_dump(),
+            "error": self.error_message,
+            "warnings": list(self.warnings),
+            "attempts": self.attempts,
+            "cache_hit": self.cache_hit,
+            "repaired": self.repaired,
+            "missing_articles": self.missing_articles,
+            "tokens_saved": self.tokens_saved,
+            "timings": self.timings,
+            "trace_id": self.trace.trace_id,
+        }
+
+def _store_in_cache(cache, cache_key: str, report: NewsReport) -> None:
+    """Сохраняет непустой выпуск в кэш, не прерывая генерацию при ошибке записи."""
+    if cache is None or not report.articles:
+        return
+    try:
+        cache.set(cache_key, report)
+    except Exception as e:
+        print(f"Не удалось сохранить выпуск в кэш: {e}")
+
+# --- Общие шаги генерации (используются синхронной и асинхронной версиями) ---
+def build_context(docs) -> str:
+    """Собирает контекст для промпта из найденных событий в пределах бюджета токенов (см. prompt_budget.py)."""
+    return build_budgeted_context(docs)[0]
+
+def _retrieve_context(run: GenerationResult, target_date: str, num_articles: int, date_window_days=None, year_range=None,
+                      locations=None, categories=None):
+    """Шаг 1: находит события для даты и собирает из них контекст. Возвращает None, если контекста нет."""
     try:
-        retriever = get_retriever(k=num_articles + 2) # Запросим чуть больше контекста
-        query = f"События около {target_date}"
-        relevant_docs = retriever.invoke(query)
+        k = num_articles + 2 # Запросим чуть больше контекста
+        with run.trace.span("retrieval", k=k) as span:
+            # Ищем ближайшие по дате события (бинарный поиск), семантика — только запасной вариант
+            relevant_docs = retrieve_events(target_date, k=k, window_days=date_window_days,
+                                            year_range=year_range, locations=locations, categories=categories)
+            span.attrs["docs"] = len(relevant_docs)
         if not relevant_docs:
-            st.warning(f"Не найдено релевантных исторических событий для даты '{target_date}'. Генерация невозможна.")
-            return NewsReport(articles=[]) # Возвращаем пустой отчет
-        context = "\n\n".join([doc.page_content for doc in relevant_docs])
+            run.warnings.append(f"Не найдено релевантных исторических событий для даты '{target_date}'. Генерация невозможна.")
+            return None
+        with run.trace.span("context_budget") as span:
+            # Дубли событий убираются, длинные описания обрезаются — в промпт идёт меньше токенов
+            context, budget = build_budgeted_context(relevant_docs)
+            span.attrs.update(budget)
+        run.trace.set(context_docs=len(relevant_docs), context_chars=len(context), context_tokens=budget["tokens"],
+                      context_tokens_saved=budget["tokens_saved"])
         print(f"Найденный контекст (первые 500 символов):\n{context[:600]}...")
+        return context
     except Exception as e:
-        st.error(f"Ошибка при поиске событий в RAG: {e}")
         print(f"Полная ошибка RAG: {e}") # Лог для детальной отладки
-        last_error = e
-        return NewsReport(articles=[]) # Возвращаем пустой отчет при ошибке RAG
+        run.fail(f"Ошибка при поиске событий в RAG: {e}", e)
+        return None
 
-    # 2. Генерируем новости с помощью LLM и парсера
+def _lookup_cache(trace: Trace, target_date: str, era_style: str, num_articles: int, context: str, use_cache: bool):
+    """Шаг 1.5: ищет готовый выпуск в кэше. Возвращает (кэш или None, ключ, выпуск или None)."""
+    cache_key = make_cache_key(target_date, era_style, num_articles, context, PROMPT_TEMPLATE_ID)
+    if not use_cache:
+        return None, cache_key, None
+    try:
+        with trace.span("cache_lookup") as span:
+            cache = get_news_cache()
+            cached_report = cache.get(cache_key)
+            span.attrs["hit"] = cached_report is not None
+        trace.set(cache_hit=cached_report is not None)
+        if cached_report is not None:
+            print(f"Выпуск для {target_date} взят из кэша.")
+        return cache, cache_key, cached_report
+    except Exception as e:
+        # Кэш — только ускорение, его сбой не должен мешать генерации
+        print(f"Кэш недоступен, генерируем без него: {e}")
+        return None, cache_key, None
+
+def _get_chain_or_none(run: GenerationResult, chain_factory=get_generation_chain):
+    """Шаг 2: возвращает общую цепочку или None при ошибке конфигурации LLM (например, нет ключа)."""
+    try:
+        with run.trace.span("llm_setup"):
+            return chain_factory() # Цепочка и клиент создаются один раз на процесс
+    except ValueError as ve:
+        run.fail(f"Ошибка конфигурации LLM: {ve}", ve)
+        return None
+
+def _accept_result(run: GenerationResult, result, cache, cache_key: str):
+    """Проверяет результат цепочки; при необходимости вручную извлекает JSON. Возвращает NewsReport или None."""
+    # Проверяем, что результат имеет ожидаемый тип (NewsReport)
+    if isinstance(result, NewsReport):
+        print("Генерация и парсинг прошли успешно.")
+        run.clear_error() # Сбрасываем ошибку прошлых попыток при успехе
+        _store_in_cache(cache, cache_key, result)
+        return result # Возвращаем успешный результат
+
+    # Если парсер вернул что-то другое (например, строку при ошибке)
+    print(f"Неожиданный тип результата от парсера: {type(result)}. Результат: {result}")
+    run.error = exceptions.OutputParserException(f"Неожиданный тип результата от парсера: {type(result)}")
+    # Попытка ручного извлечения JSON из строки (если result это строка)
+    if isinstance(result, str):
+        with run.trace.span("manual_json_fallback") as span:
+            # Снимаем ```-ограду и висячие запятые, из оборванного ответа берём законченные статьи
+            articles, complete, _ = salvage_articles(result)
+            span.attrs["recovered"] = bool(articles)
+            if articles:
+                news_report = NewsReport(articles=articles)
+                print("Удалось вручную распарсить и валидировать JSON из строки.")
+                run.clear_error()
+                if complete:
+                    _store_in_cache(cache, cache_key, news_report)
+                return news_report
+            print("Не удалось найти JSON в строке ответа.")
+            run.error = exceptions.OutputParserException("Не удалось найти JSON в строке ответа.", llm_output=result)
+    # Если ручной парсинг не удался или тип был не строка, переходим к следующей попытке
+    return None
+
+# --- Вызов цепочки по шагам (для таймингов этапов) ---
+# Цепочка prompt | llm | parser выполняется по шагам: так видно, сколько занимает рендер промпта,
+# ожидание первого токена, генерация целиком и разбор ответа
+def _record_usage(span, message) -> None:
+    """Переносит в спан число токенов из usage_metadata ответа (если API его вернул)."""
+    usage = getattr(message, "usage_metadata", None)
+    if usage:
+        span.attrs["prompt_tokens"] = usage.get("input_tokens")
+        span.attrs["completion_tokens"] = usage.get("output_tokens")
+
+def _render_prompt(trace: Trace, prompt, chain_input: dict):
+    with trace.span("prompt_render") as span:
+        prompt_value = prompt.invoke(chain_input)
+        span.attrs["prompt_chars"] = sum(len(message.content) for message in prompt_value.to_messages())
+        # Экономия считается на каждый отправленный промпт: повторы и дозапросы тоже дешевле
+        saved = trace.attrs.get("context_tokens_saved", 0) + _schema_tokens_saved()
+        span.attrs["tokens_saved"] = saved
+        trace.set(prompt_tokens_saved=trace.attrs.get("prompt_tokens_saved", 0) + saved)
+    return prompt_value
+
+def _parse_message(trace: Trace, parser, message):
+    with trace.span("parse"):
+        if message is None:
+            raise exceptions.OutputParserException("LLM вернул пустой ответ.")
+        try:
+            report = parser.invoke(message)
+        except exceptions.OutputParserException as ope:
+            # В ошибке должен быть весь сырой ответ, а не вырезанный парсером фрагмент: из него спасаем статьи
+            raise exceptions.OutputParserException(str(ope), llm_output=message.content) from ope
+        # PydanticOutputParser сам «закрывает» оборванный JSON, и обрезанная статья проходит валидацию.
+        # Поэтому ответ проверяется строгим разбором: массив закрыт и все статьи целы. Законченный ответ
+        # с меньшим числом статей принимается: промпт просит «примерно» N, а при узких фильтрах событий мало
+        _, complete, skipped = salvage_articles(message.content)
+        if not complete or skipped:
+            raise exceptions.OutputParserException("Ответ LLM оборван или содержит некорректные статьи.",
+                                                   llm_output=message.content)
+        return report
+
+def _run_chain(trace: Trace, chain, chain_input: dict):
+    """Синхронно выполняет цепочку генерации, записывая спаны prompt_render, llm и parse."""
+    prompt, llm, parser = chain.steps
+    prompt_value = _render_prompt(trace, prompt, chain_input)
+    with trace.span("llm") as span:
+        message = None
+        for chunk in llm.stream(prompt_value):
+            if message is None:
+                span.attrs["ttft"] = span.elapsed()
+                message = chunk
+            else:
+                message += chunk
+        _record_usage(span, message)
+    return _parse_message(trace, parser, message)
+
+async def _arun_chain(trace: Trace, chain, chain_input: dict):
+    """Асинхронный вариант _run_chain; ожидание слота семафора записывается отдельным спаном llm_queue."""
+    prompt, llm, parser = chain.steps
+    prompt_value = _render_prompt(trace, prompt, chain_input)
+    semaphore = _get_llm_semaphore()
+    with trace.span("llm_queue"):
+        await semaphore.acquire()
     try:
-        chain = create_generation_chain()
-        # Получаем инструкции по форматированию еще раз (хотя они уже внутри chain)
-        pydantic_parser = PydanticOutputParser(pydantic_object=NewsReport)
-        format_instructions = pydantic_parser.get_format_instructions()
-    except ValueError as ve: # Ловим ошибку инициализации LLM (например, нет ключа)
-        st.error(f"Ошибка конфигурации LLM: {ve}")
-        last_error = ve
+        with trace.span("llm") as span:
+            message = None
+            async for chunk in llm.astream(prompt_value):
+                if message is None:
+                    span.attrs["ttft"] = span.elapsed()
+                    message = chunk
+                else:
+                    message += chunk
+            _record_usage(span, message)
+    finally:
+        semaphore.release()
+    return _parse_message(trace, parser, message)
+
+# --- Восстановление после ошибки парсинга (без полного повтора запроса) ---
+def _salvage_failed_output(trace: Trace, ope, num_articles: int):
+    """Достаёт законченные статьи из сырого ответа неудачной попытки. Возвращает (статьи, сколько дописать)."""
+    raw_output = getattr(ope, "llm_output", None)
+    if not raw_output:
+        return [], 0
+    with trace.span("json_repair") as span:
+        articles, complete, skipped = salvage_articles(str(raw_output))
+        span.attrs.update(salvaged=len(articles), skipped=skipped, complete=complete)
+    if not articles:
+        return [], 0
+    # Сколько статей было в оборванной или битой части ответа, неизвестно: дозапрашиваем до запрошенного числа
+    return articles, max(num_articles - len(articles), 0)
+
+def _topup_input(chain_input: dict, articles, missing: int) -> dict:
+    """Входные данные для запроса только недостающих статей (уже готовые не повторяются)."""
+    headlines = "; ".join(article.headline for article in articles)
+    return {**chain_input, "num_articles": missing,
+            "context": f"{chain_input['context']}\n\nЭти заметки уже написаны, не повторяй их: {headlines}"}
+
+def _merge_topup(trace: Trace, articles, missing: int, topup_result, topup_error):
+    """Добавляет статьи из дозапроса (или спасённые из его неудачного ответа). Возвращает (статьи, сколько не хватает)."""
+    if isinstance(topup_result, NewsReport):
+        extra = list(topup_result.articles)
+    elif topup_error is not None:
+        extra, _ = _salvage_failed_output(trace, topup_error, missing)
+    else:
+        extra = []
+    extra = extra[:missing]
+    return articles + extra, missing - len(extra)
+
+def _request_topup(trace: Trace, chain, chain_input: dict, articles, missing: int):
+    """Дозапрашивает только недостающие статьи. Возвращает (все статьи, сколько по-прежнему не хватает)."""
+    topup_result = topup_error = None
+    with trace.span("json_topup", requested=missing):
+        try:
+            topup_result = _run_chain(trace, chain, _topup_input(chain_input, articles, missing))
+        except exceptions.OutputParserException as e:
+            topup_error = e
+        except Exception as e:
+            print(f"Не удалось дозапросить недостающие статьи: {e}")
+    return _merge_topup(trace, articles, missing, topup_result, topup_error)
+
+def _finish_recovery(run: GenerationResult, articles, missing: int, cache, cache_key: str) -> NewsReport:
+    report = NewsReport(articles=articles)
+    print(f"Ответ LLM восстановлен без повтора: {len(articles)} статей" + (f", не хватает {missing}." if missing else "."))
+    run.trace.set(repaired=True, missing_articles=missing)
+    run.clear_error()
+    # Неполный выпуск лучше пустого, но в кэш кладём только полный
+    if missing:
+        run.warnings.append(f"Ответ LLM восстановлен частично: не хватает статей — {missing}.")
+    else:
+        _store_in_cache(cache, cache_key, report)
+    return report
+
+def _recover_from_parse_failure(run: GenerationResult, ope, chain, chain_input: dict, cache, cache_key: str):
+    """Чинит ответ, на котором упал парсер, и при нехватке статей дозапрашивает только недостающие.
+
+    Возвращает NewsReport или None, если спасти нечего (тогда делается обычная повторная попытка).
+    """
+    trace = run.trace
+    articles, missing = _salvage_failed_output(trace, ope, chain_input["num_articles"])
+    if not articles:
+        return None
+    if missing:
+        articles, missing = _request_topup(trace, chain, chain_input, articles, missing)
+    return _finish_recovery(run, articles, missing, cache, cache_key)
+
+async def _arecover_from_parse_failure(run: GenerationResult, ope, chain, chain_input: dict, cache, cache_key: str):
+    """Асинхронный вариант _recover_from_parse_failure."""
+    trace = run.trace
+    articles, missing = _salvage_failed_output(trace, ope, chain_input["num_articles"])
+    if not articles:
+        return None
+    if missing:
+        topup_result = topup_error = None
+        with trace.span("json_topup", requested=missing):
+            try:
+                topup_result = await _arun_chain(trace, chain, _topup_input(chain_input, articles, missing))
+            except exceptions.OutputParserException as e:
+                topup_error = e
+            except Exception as e:
+                print(f"Не удалось дозапросить недостающие статьи: {e}")
+        articles, missing = _merge_topup(trace, articles, missing, topup_result, topup_error)
+    return await asyncio.to_thread(_finish_recovery, run, articles, missing, cache, cache_key)
+
+def _note_parse_failure(run: GenerationResult, ope, attempt: int) -> None:
+    """Фиксирует ошибку парсинга Pydantic перед следующей попыткой."""
+    print(f"Ошибка парсинга Pydantic на попытке {attempt + 1}: {ope}")
+    # Пытаемся получить сырой вывод LLM из атрибутов ошибки, если он там есть
+    raw_output = getattr(ope, 'llm_output', str(ope))
+    run.warnings.append(f"Попытка {attempt + 1}: Не удалось разобрать ответ LLM. Пробуем снова...")
+    print(f"--- Сырой вывод LLM (при ошибке парсинга) ---\n{raw_output}\n---")
+    run.error = ope # Сохраняем ошибку
+
+def _note_unexpected_error(run: GenerationResult, e, attempt: int) -> None:
+    """Фиксирует сетевую/API ошибку, после которой попытки прекращаются."""
+    print(f"Неожиданная ошибка на попытке {attempt + 1}: {e}")
+    run.fail(f"Произошла неожиданная ошибка при генерации: {e}", e)
+
+def _report_failure(run: GenerationResult) -> NewsReport:
+    """Фиксирует неудачу всех попыток и возвращает пустой отчет."""
+    if run.error_message is None:
+        run.error_message = f"Не удалось сгенерировать новости после {run.attempts} попыток."
+    # Возвращаем пустой отчет, если ничего не получилось
+    return NewsReport(articles=[])
+
+def _backoff_delay(attempt: int) -> float:
+    """Пауза перед следующей попыткой (экспоненциально растёт с номером попытки)."""
+    return RETRY_BACKOFF_SECONDS * (2 ** attempt)
+
+def _start_run(trace, operation: str, target_date: str, era_style: str, num_articles: int) -> GenerationResult:
+    """Создаёт результат запроса с переданной трассой (например, из отладочной панели app.py) или новой."""
+    trace = trace if trace is not None else Trace()
+    trace.operation = trace.operation or operation
+    trace.set(target_date=target_date, era_style=era_style, num_articles=num_articles)
+    return GenerationResult(trace=trace)
+
+def _finish_run(run: GenerationResult) -> None:
+    """Закрывает трассу с исходом ok / error / empty (нет контекста или статей без ошибки)."""
+    run.trace.finish("ok" if run.ok else ("error" if run.error is not None else "empty"))
+
+# --- Функция generate_news ---
+def generate_news(target_date: str, era_style: str = "XIX", num_articles: int = 3, date_window_days=None, use_cache: bool = True,
+                  year_range=None, locations=None, categories=None, trace: Trace = None) -> GenerationResult:
+    """Основная функция для генерации новостей с обработкой ошибок и повторными попытками.
+
+    При use_cache=True готовый выпуск берётся из дискового кэша (и сохраняется в него),
+    use_cache=False принудительно запрашивает LLM заново. year_range, locations и categories
+    ограничивают события, из которых собирается контекст. В trace (telemetry.Trace)
+    записываются тайминги этапов; если не передана, создаётся своя.
+
+    Возвращает GenerationResult: выпуск (report), ошибку, предупреждения, число попыток,
+    признак попадания в кэш и тайминги. Функция не обращается к UI и безопасна для параллельных вызовов.
+    """
+    print(f"Запрос на генерацию новостей для даты: {target_date}, стиль: {era_style}")
+    run = _start_run(trace, "generate_news", target_date, era_style, num_articles)
+    try:
+        # 1. Получаем контекст из RAG
+        context = _retrieve_context(run, target_date, num_articles, date_window_days, year_range, locations, categories)
+        if context is not None:
+            run.report = _generate_from_context(run, target_date, era_style, num_articles, context, use_cache)
+        return run
+    finally:
+        _finish_run(run)
+
+def generate_news_with_context(target_date: str, context: str, era_style: str = "XIX", num_articles: int = 3, use_cache: bool = True,
+                               trace: Trace = None) -> GenerationResult:
+    """Генерирует выпуск по уже найденному контексту (для пакетной генерации, где поиск сделан заранее)."""
+    run = _start_run(trace, "generate_news_with_context", target_date, era_style, num_articles)
+    run.trace.set(context_chars=len(context))
+    try:
+        run.report = _generate_from_context(run, target_date, era_style, num_articles, context, use_cache)
+        return run
+    finally:
+        _finish_run(run)
+
+def _generate_from_context(run: GenerationResult, target_date: str, era_style: str, num_articles: int, context: str,
+                           use_cache: bool) -> NewsReport:
+    """Шаги 1.5–2: кэш, затем LLM с повторными попытками."""
+    trace = run.trace
+    cache, cache_key, cached_report = _lookup_cache(trace, target_date, era_style, num_articles, context, use_cache)
+    if cached_report is not None:
+        return cached_report
+
+    # 2. Генерируем новости с помощью LLM и парсера
+    chain = _get_chain_or_none(run)
+    if chain is None:
         return NewsReport(articles=[])
+    # Формируем входные данные для цепочки
+    chain_input = {
+        "date_input": target_date,
+        "era_style": era_style,
+        "num_articles": num_articles,
+        "context": context
+    }
 
     for attempt in range(MAX_RETRIES):
         print(f"Попытка генерации {attempt + 1}/{MAX_RETRIES}...")
+        trace.set(attempts=attempt + 1)
         try:
-            # Формируем входные данные для цепочки
-            chain_input = {
-                "date_input": target_date,
-                "era_style": era_style,
-                "num_articles": num_articles,
-                "context": context,
-                "format_instructions": format_instructions # Передаем инструкции в контекст промпта
-            }
             # Запускаем цепочку
-            result = chain.invoke(chain_input)
-
-            # Проверяем, что результат имеет ожидаемый тип (NewsReport)
-            if isinstance(result, NewsReport):
-                print("Генерация и парсинг прошли успешно.")
-                last_error = None # Сбрасываем ошибку при успехе
-                return result # Возвращаем успешный результат
-            else:
-                # Если парсер вернул что-то другое (например, строку при ошибке)
-                print(f"Неожиданный тип результата от парсера: {type(result)}. Результат: {result}")
-                last_error = exceptions.OutputParsingError(f"Неожиданный тип результата от парсера: {type(result)}")
-                # Попытка ручного извлечения JSON из строки (если result это строка)
-                if isinstance(result, str):
-                    try:
-                         # Ищем JSON объект в строке
-                         json_match = re.search(r'\{.*\}', result, re.DOTALL)
-                         if json_match:
-                            json_str = json_match.group(0)
-                            parsed_json = json.loads(json_str)
-                            # Валидируем вручную распарсенный JSON через Pydantic
-                            news_report = NewsReport.model_validate(parsed_json) # Используем model_validate для Pydantic v2+
-                            print("Удалось вручную распарсить и валидировать JSON из строки.")
-                            last_error = None
-                            return news_report
-                         else:
-                            print("Не удалось найти JSON в строке ответа.")
-                            last_error = exceptions.OutputParsingError("Не удалось найти JSON в строке ответа.")
-                    except (json.JSONDecodeError, ValidationError) as manual_parse_error:
-                        print(f"Ошибка ручного парсинга/валидации JSON: {manual_parse_error}")
-                        last_error = exceptions.OutputParsingError(f"Ошибка ручного парсинга/валидации JSON: {manual_parse_error}")
-                # Если ручной парсинг не удался или тип был не строка, переходим к следующей попытке
-
+            report = _accept_result(run, _run_chain(trace, chain, chain_input), cache, cache_key)
+            if report is not None:
+                return report
         # Ловим специфичную ошибку парсинга от LangChain
-        except exceptions.OutputParsingError as ope:
-            print(f"Ошибка парсинга Pydantic на попытке {attempt + 1}: {ope}")
-            # Пытаемся получить сырой вывод LLM из атрибутов ошибки, если он там есть
-            raw_output = getattr(ope, 'llm_output', str(ope))
-            # Выводим предупреждение в UI
-            st.warning(f"Попытка {attempt + 1}: Не удалось разобрать ответ LLM. Пробуем снова...")
-            print(f"--- Сырой вывод LLM (при ошибке парсинга) ---\n{raw_output}\n---")
-            last_error = ope # Сохраняем ошибку
-            # Ждем немного перед следующей попыткой
-            time.sleep(2)
-
+        except exceptions.OutputParserException as ope:
+            # Сначала чиним то, что уже пришло: это дешевле и быстрее полного повтора
+            report = _recover_from_parse_failure(run, ope, chain, chain_input, cache, cache_key)
+            if report is not None:
+                return report
+            _note_parse_failure(run, ope, attempt)
+            if attempt + 1 < MAX_RETRIES:
+                with trace.span("retry_backoff"):
+                    time.sleep(_backoff_delay(attempt)) # Ждем немного перед следующей попыткой
         # Ловим другие возможные ошибки (сетевые, API и т.д.)
         except Exception as e:
-            print(f"Неожиданная ошибка на попытке {attempt + 1}: {e}")
-            st.error(f"Произошла неожиданная ошибка при генерации: {e}")
-            last_error = e # Сохраняем ошибку
+            _note_unexpected_error(run, e, attempt)
             break # Прерываем цикл попыток при других ошибках
 
     # Если все попытки не удались
-    st.error(f"Не удалось сгенерировать новости после {MAX_RETRIES} попыток.")
-    if last_error:
-        # Показываем последнюю ошибку в UI
-        st.error(f"Детали последней ошибки: {last_error}")
-        # Если в ошибке был сырой вывод, покажем его для отладки
-        raw_output = getattr(last_error, 'llm_output', None)
-        if raw_output:
-            st.text_area("Последний сырой ответ от LLM (для отладки):", str(raw_output), height=200)
+    return _report_failure(run)
 
-    # Возвращаем пустой отчет, если ничего не получилось
-    return NewsReport(articles=[])
+# --- Асинхронная версия generate_news ---
+# Семафор ограничивает число одновременных запросов к LLM; asyncio-примитивы привязаны к циклу событий,
+# поэтому храним по семафору на каждый цикл
+_llm_semaphores = weakref.WeakKeyDictionary()
+# Пул соединений httpx.AsyncClient тоже привязан к циклу, в котором открыты соединения: после asyncio.run
+# цикл закрыт, и общий клиент отвечал бы "Event loop is closed". Поэтому LLM с асинхронным клиентом
+# и цепочка на нём создаются по одной на цикл
+_async_chains = weakref.WeakKeyDictionary()
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    loop = asyncio.get_running_loop()
+    semaphore = _llm_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        _llm_semaphores[loop] = semaphore
+    return semaphore
+
+def get_async_generation_chain():
+    """Возвращает цепочку генерации для текущего цикла событий (свой ChatOpenAI и пул соединений на цикл)."""
+    loop = asyncio.get_running_loop()
+    chain = _async_chains.get(loop)
+    if chain is None:
+        chain = create_generation_chain(get_llm())
+        _async_chains[loop] = chain
+    return chain
+
+async def agenerate_news(target_date: str, era_style: str = "XIX", num_articles: int = 3, date_window_days=None, use_cache: bool = True,
+                         year_range=None, locations=None, categories=None, trace: Trace = None) -> GenerationResult:
+    """Асинхронный аналог generate_news: не блокирует поток во время запроса к LLM и пауз между попытками.
+
+    Число одновременных запросов к LLM в одном цикле событий ограничено LLM_MAX_CONCURRENCY.
+    """
+    print(f"Асинхронный запрос на генерацию новостей для даты: {target_date}, стиль: {era_style}")
+    run = _start_run(trace, "agenerate_news", target_date, era_style, num_articles)
+    try:
+        run.report = await _agenerate(run, target_date, era_style, num_articles, date_window_days, use_cache,
+                                      year_range, locations, categories)
+        return run
+    finally:
+        _finish_run(run)
+
+async def _agenerate(run: GenerationResult, target_date: str, era_style: str, num_articles: int, date_window_days, use_cache: bool,
+                     year_range, locations, categories) -> NewsReport:
+    trace = run.trace
+    # Поиск и кэш — синхронные операции с диском/моделью, выносим их в пул потоков
+    context = await asyncio.to_thread(_retrieve_context, run, target_date, num_articles, date_window_days, year_range, locations, categories)
+    if context is None:
+        return NewsReport(articles=[])
+    cache, cache_key, cached_report = await asyncio.to_thread(_lookup_cache, trace, target_date, era_style, num_articles, context, use_cache)
+    if cached_report is not None:
+        return cached_report
+
+    chain = _get_chain_or_none(run, get_async_generation_chain)
+    if chain is None:
+        return NewsReport(articles=[])
+    chain_input = {
+        "date_input": target_date,
+        "era_style": era_style,
+        "num_articles": num_articles,
+        "context": context
+    }
+
+    for attempt in range(MAX_RETRIES):
+        print(f"Асинхронная попытка генерации {attempt + 1}/{MAX_RETRIES}...")
+        trace.set(attempts=attempt + 1)
+        try:
+            result = await _arun_chain(trace, chain, chain_input)
+            report = await asyncio.to_thread(_accept_result, run, result, cache, cache_key)
+            if report is not None:
+                return report
+        except exceptions.OutputParserException as ope:
+            report = await _arecover_from_parse_failure(run, ope, chain, chain_input, cache, cache_key)
+            if report is not None:
+                return report
+            _note_parse_failure(run, ope, attempt)
+            if attempt + 1 < MAX_RETRIES:
+                with trace.span("retry_backoff"):
+                    await asyncio.sleep(_backoff_delay(attempt)) # Неблокирующая пауза: слот семафора уже освобождён
+        except Exception as e:
+            _note_unexpected_error(run, e, attempt)
+            break
+
+    return _report_failure(run)
+
+async def agenerate_news_many(requests) -> list:
+    """Параллельно генерирует несколько выпусков; requests — список словарей с аргументами agenerate_news.
+
+    Возвращает список GenerationResult в том же порядке.
+    """
+    return await asyncio.gather(*(agenerate_news(**request) for request in requests))
+
+# --- Потоковая генерация ---
+class NewsStream:
+    """Итератор статей потоковой генерации; когда он исчерпан, в result лежит итог запроса (GenerationResult)."""
+
+    def __init__(self, articles, result: GenerationResult):
+        self._articles = articles
+        self.result = result
+
+    def __iter__(self):
+        return self._articles
+
+def stream_news(target_date: str, era_style: str = "XIX", num_articles: int = 3, date_window_days=None, use_cache: bool = True,
+                year_range=None, locations=None, categories=None, trace: Trace = None) -> NewsStream:
+    """Потоковая генерация: NewsArticle отдаётся, как только LLM дописал её объект в массиве articles.
+
+    Первые новости можно показывать, пока следующие ещё генерируются. Если поток оборвался, недостающие
+    статьи дозапрашиваются и тоже отдаются через итератор; повторная попытка делается, только если
+    из ответа не удалось извлечь ни одной статьи.
+    """
+    print(f"Потоковый запрос на генерацию новостей для даты: {target_date}, стиль: {era_style}")
+    run = _start_run(trace, "stream_news", target_date, era_style, num_articles)
+    return NewsStream(_stream_articles(run, target_date, era_style, num_articles, date_window_days, use_cache,
+                                       year_range, locations, categories), run)
+
+def _stream_articles(run: GenerationResult, *args):
+    articles = []
+    try:
+        for article in _stream(run, *args):
+            articles.append(article)
+            yield article
+    finally:
+        run.report = NewsReport(articles=articles)
+        _finish_run(run)
+
+def _stream(run: GenerationResult, target_date: str, era_style: str, num_articles: int, date_window_days, use_cache: bool,
+            year_range, locations, categories):
+    trace = run.trace
+    context = _retrieve_context(run, target_date, num_articles, date_window_days, year_range, locations, categories)
+    if context is None:
+        return
+    cache, cache_key, cached_report = _lookup_cache(trace, target_date, era_style, num_articles, context, use_cache)
+    if cached_report is not None:
+        yield from cached_report.articles
+        return
+
+    chain = _get_chain_or_none(run, get_streaming_chain)
+    if chain is None:
+        return
+    chain_input = {
+        "date_input": target_date,
+        "era_style": era_style,
+        "num_articles": num_articles,
+        "context": context
+    }
+    prompt, llm, _ = chain.steps
+
+    for attempt in range(MAX_RETRIES):
+        print(f"Потоковая попытка генерации {attempt + 1}/{MAX_RETRIES}...")
+        trace.set(attempts=attempt + 1)
+        stream_parser = ArticleStreamParser()
+        articles = []
+        try:
+            prompt_value = _render_prompt(trace, prompt, chain_input)
+            # Разбор идёт по ходу потока, поэтому отдельного спана parse здесь нет
+            with trace.span("llm") as span:
+                message = None
+                for chunk in llm.stream(prompt_value):
+                    if message is None:
+                        span.attrs["ttft"] = span.elapsed()
+                        message = chunk
+                    else:
+                        message += chunk
+                    for article in stream_parser.feed(chunk.content):
+                        if not articles:
+                            span.attrs["first_article"] = span.elapsed()
+                        articles.append(article)
+                        yield article
+                _record_usage(span, message)
+                span.attrs["articles"] = len(articles)
+        except Exception as e:
+            if not articles:
+                _note_unexpected_error(run, e, attempt)
+                break
+            # Часть статей уже показана: это неполный выпуск (с предупреждением), а не ошибка —
+            # при непустом выпуске UI ошибок не показывает
+            print(f"Поток ответа LLM прервался после {len(articles)} статей: {e}")
+            run.warnings.append(f"Поток ответа LLM прервался после {len(articles)} статей: {e}")
+
+        if articles:
+            print(f"Потоковая генерация завершена: {len(articles)} статей.")
+            run.clear_error()
+            # Цельный ответ (массив закрыт, битых статей нет) принимается как есть, даже если статей меньше N
+            if stream_parser.complete and not stream_parser.skipped:
+                _store_in_cache(cache, cache_key, NewsReport(articles=articles))
+                return
+            # Поток оборвался или часть статей битая: как и при ошибке парсинга, дозапрашиваем только недостающие
+            missing = max(num_articles - len(articles), 0)
+            if missing:
+                recovered, missing = _request_topup(trace, get_generation_chain(), chain_input, articles, missing)
+                yield from recovered[len(articles):]
+                articles = recovered
+            _finish_recovery(run, articles, missing, cache, cache_key)
+            return
+        _note_parse_failure(
+            run,
+            exceptions.OutputParserException("В ответе LLM не найдено ни одной статьи.", llm_output=stream_parser.buffer),
+            attempt
+        )
+        if attempt + 1 < MAX_RETRIES:
+            with trace.span("retry_backoff"):
+                time.sleep(_backoff_delay(attempt))
+
+    _report_failure(run)
 
 # --- Блок для локального тестирования ---
 if __name__ == '__main__':
@@ -205,11 +845,11 @@ if __name__ == '__main__':
         # os.environ.setdefault("FORGETAPI_KEY", "ВАШ_КЛЮЧ_ЗДЕСЬ")
         # os.environ.setdefault("FORGETAPI_BASE_URL", "https://forgetapi.ru/v1")
 
-        report = generate_news(test_date, era_style="XVIII", num_articles=2)
+        result = generate_news(test_date, era_style="XVIII", num_articles=2)
 
-        if report and report.articles:
+        if result.ok:
             print(f"\n--- Сгенерированный отчет для {test_date} ---")
-            for article in report.articles:
+            for article in result.articles:
                 print(f"\nЗаголовок: {article.headline}")
                 print(f"Рубрика: {article.rubric}")
                 print(f"Дата/Место: {article.date_location}")
@@ -218,6 +858,10 @@ if __name__ == '__main__':
             print("--- Конец отчета ---")
         else:
             print("Не удалось сгенерировать новости (возможно, после всех попыток).")
+            for warning in result.warnings:
+                print(f"Предупреждение: {warning}")
+            if result.error_message:
+                print(f"Ошибка: {result.error_message}")
 
     except ValueError as ve:
          print(f"Ошибка конфигурации при тесте: {ve}")
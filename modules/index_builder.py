@@ -0,0 +1,276 @@
+# modules/index_builder.py
+"""Инкрементальная сборка индекса FAISS из CSV с событиями (замена create_vector_db.ipynb).
+
+Запуск: python -m modules.index_builder [--csv data/historical_events.csv] [--index faiss_index_historical]
+Эмбеддинги считаются только для новых или изменённых строк; хэши содержимого хранятся в manifest.json.
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+import time
+import uuid
+from itertools import islice
+from typing import Dict, Iterator, List, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from .date_index import CALENDAR_END, CALENDAR_START
+from .events import CSV_FILE_PATH, iter_event_rows, row_to_document
+from .rag import EMBEDDING_MODEL_NAME, INDEX_LOAD_PATH, QUERY_VECTORS_PATH, semantic_query
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+
+
+def document_hash(doc: Document) -> str:
+    """Хэш содержимого документа: меняется при любой правке текста или метаданных строки."""
+    metadata = {key: value for key, value in doc.metadata.items() if key != "source"}
+    payload = json.dumps({"content": doc.page_content, "metadata": metadata}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _atomic_write(path: str, write) -> None:
+    """Пишет файл через временный файл в той же папке и os.replace: читатели не видят полузаписанный файл."""
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    os.close(fd)
+    try:
+        write(tmp_path)
+        os.chmod(tmp_path, 0o644) # mkstemp создаёт файл с правами 0600
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class IndexState:
+    """Индекс FAISS (IndexIDMap2 с явными id), docstore LangChain и манифест хэшей строк."""
+
+    def __init__(self, index, docstore: InMemoryDocstore, index_to_docstore_id: Dict[int, str], rows: Dict[str, dict]):
+        self.index = index
+        self.docstore = docstore
+        self.index_to_docstore_id = index_to_docstore_id
+        self.rows = rows # ключ строки -> {"id": id в FAISS, "docstore_id": id документа}
+        self.dirty = False # Есть несохранённые изменения
+
+    @property
+    def next_id(self) -> int:
+        return max(self.index_to_docstore_id, default=-1) + 1
+
+    @classmethod
+    def empty(cls, dimension: int) -> "IndexState":
+        return cls(faiss.IndexIDMap2(faiss.IndexFlatL2(dimension)), InMemoryDocstore({}), {}, {})
+
+    @classmethod
+    def load(cls, index_path: str) -> "IndexState":
+        """Загружает индекс, сохранённый FAISS.save_local или этим модулем."""
+        index = faiss.read_index(os.path.join(index_path, "index.faiss"))
+        with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+        if not isinstance(index, faiss.IndexIDMap2):
+            # Индекс из ноутбука: позиции 0..n-1 и есть id, переносим векторы в IndexIDMap2
+            print("Преобразование индекса в IndexIDMap2 (однократно)...")
+            vectors = index.reconstruct_n(0, index.ntotal)
+            id_map = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+            id_map.add_with_ids(vectors, np.arange(index.ntotal, dtype=np.int64))
+            index = id_map
+            converted = True
+        else:
+            converted = False
+
+        state = cls(index, docstore, dict(index_to_docstore_id), {})
+        state.dirty = converted
+        manifest_path = os.path.join(index_path, MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            state.rows = manifest.get("rows", {})
+        present_ids = set(faiss.vector_to_array(index.id_map).tolist())
+        if {entry["id"] for entry in state.rows.values()} != present_ids:
+            # Манифеста нет или он не совпадает с индексом (например, прерванная запись) — восстанавливаем по docstore
+            print("Манифест отсутствует или устарел, восстанавливаем его по документам индекса...")
+            state.rows = state._rows_from_docstore()
+            state.dirty = True
+        return state
+
+    def _rows_from_docstore(self) -> Dict[str, dict]:
+        rows = {}
+        for faiss_id in faiss.vector_to_array(self.index.id_map).tolist():
+            docstore_id = self.index_to_docstore_id.get(faiss_id)
+            doc = self.docstore.search(docstore_id) if docstore_id is not None else None
+            if isinstance(doc, Document):
+                rows[_row_key(document_hash(doc), rows)] = {"id": faiss_id, "docstore_id": docstore_id}
+        return rows
+
+    def add(self, keyed_docs: List[Tuple[str, Document]], vectors: np.ndarray) -> None:
+        """Добавляет документы и их векторы с новыми id."""
+        start = self.next_id
+        ids = np.arange(start, start + len(keyed_docs), dtype=np.int64)
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), ids)
+        for faiss_id, (key, doc) in zip(ids.tolist(), keyed_docs):
+            docstore_id = str(uuid.uuid4())
+            self.docstore.add({docstore_id: doc})
+            self.index_to_docstore_id[faiss_id] = docstore_id
+            self.rows[key] = {"id": faiss_id, "docstore_id": docstore_id}
+        self.dirty = True
+
+    def remove(self, keys: List[str]) -> None:
+        """Удаляет строки, которых больше нет в CSV (или которые изменились)."""
+        if not keys:
+            return
+        entries = [self.rows.pop(key) for key in keys]
+        self.index.remove_ids(np.array([entry["id"] for entry in entries], dtype=np.int64))
+        self.docstore.delete([entry["docstore_id"] for entry in entries])
+        for entry in entries:
+            self.index_to_docstore_id.pop(entry["id"], None)
+        self.dirty = True
+
+    def save(self, index_path: str) -> None:
+        """Атомарно записывает index.pkl, index.faiss и manifest.json (в этом порядке)."""
+        os.makedirs(index_path, exist_ok=True)
+
+        def write_pkl(path):
+            with open(path, "wb") as f:
+                pickle.dump((self.docstore, self.index_to_docstore_id), f)
+
+        def write_manifest(path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "model": EMBEDDING_MODEL_NAME, "rows": self.rows}, f, ensure_ascii=False)
+
+        # Сначала docstore: в нём могут быть лишние id, но не должно не хватать id из нового index.faiss
+        _atomic_write(os.path.join(index_path, "index.pkl"), write_pkl)
+        _atomic_write(os.path.join(index_path, "index.faiss"), lambda path: faiss.write_index(self.index, path))
+        # Манифест последним: если запись прервётся раньше, он не совпадёт с индексом и будет восстановлен
+        _atomic_write(os.path.join(index_path, MANIFEST_FILE), write_manifest)
+
+
+def _row_key(content_hash: str, existing) -> str:
+    """Ключ строки: хэш содержимого, а для полных дубликатов — с порядковым суффиксом."""
+    key, n = content_hash, 1
+    while key in existing:
+        key = f"{content_hash}#{n}"
+        n += 1
+    return key
+
+
+def _chunks(iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_embeddings():
+    """Загружает модель эмбеддингов (тяжёлый импорт torch делаем только при сборке)."""
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    print(f"Инициализация модели эмбеддингов: {EMBEDDING_MODEL_NAME}...")
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+
+def build_index(csv_path: str = CSV_FILE_PATH, index_path: str = INDEX_LOAD_PATH, chunk_size: int = 256,
+                batch_size: int = 64, full: bool = False, embeddings=None) -> dict:
+    """Обновляет индекс по CSV: эмбеддинги считаются только для новых и изменённых строк.
+
+    embeddings — объект с методом embed_documents (по умолчанию загружается модель EMBEDDING_MODEL_NAME,
+    но только если действительно есть что эмбеддить).
+    """
+    started = time.perf_counter()
+    has_index = all(os.path.exists(os.path.join(index_path, name)) for name in ("index.faiss", "index.pkl"))
+    state = IndexState.load(index_path) if has_index and not full else None
+    source = os.path.basename(csv_path)
+
+    seen = set()
+    added = 0
+    for chunk in _chunks(iter_event_rows(csv_path), chunk_size):
+        new_docs = []
+        for row in chunk:
+            doc = row_to_document(row, source)
+            key = _row_key(document_hash(doc), seen)
+            seen.add(key)
+            if state is None or key not in state.rows:
+                new_docs.append((key, doc))
+        if not new_docs:
+            continue
+
+        if embeddings is None:
+            embeddings = get_embeddings()
+        for batch in _chunks(new_docs, batch_size):
+            vectors = np.asarray(embeddings.embed_documents([doc.page_content for _, doc in batch]), dtype=np.float32)
+            if state is None:
+                state = IndexState.empty(vectors.shape[1])
+            state.add(batch, vectors)
+            added += len(batch)
+        print(f"Добавлено векторов: {added}...")
+
+    if state is None:
+        raise ValueError(f"В '{csv_path}' нет ни одной строки с событиями, индекс не создан.")
+
+    removed_keys = [key for key in state.rows if key not in seen]
+    state.remove(removed_keys)
+
+    stats = {"added": added, "removed": len(removed_keys), "total": state.index.ntotal}
+    if state.dirty:
+        state.save(index_path)
+        state.dirty = False
+        print(f"Индекс сохранён в '{index_path}'.")
+    else:
+        print("Индекс актуален, изменений нет.")
+    stats["elapsed"] = time.perf_counter() - started
+    print(f"Сборка индекса: добавлено {stats['added']}, удалено {stats['removed']}, всего {stats['total']} "
+          f"({stats['elapsed']:.1f} с).")
+    return stats
+
+
+def build_query_vectors(output_path: str = QUERY_VECTORS_PATH, batch_size: int = 256, embeddings=None) -> None:
+    """Предвычисляет векторы запросов "События около <дата>" для каждой даты календаря (.npy, float16).
+
+    Тогда семантический поиск по дате в приложении обходится без загрузки модели эмбеддингов.
+    """
+    started = time.perf_counter()
+    if embeddings is None:
+        embeddings = get_embeddings()
+    days = (CALENDAR_END - CALENDAR_START).days + 1
+    queries = [semantic_query(CALENDAR_START + datetime.timedelta(days=i)) for i in range(days)]
+    parts = []
+    for batch in _chunks(queries, batch_size):
+        parts.append(np.asarray(embeddings.embed_documents(batch), dtype=np.float16))
+    vectors = np.concatenate(parts)
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # np.save сам добавляет ".npy" к имени без расширения, поэтому пишем в открытый файл
+    def write_npy(path):
+        with open(path, "wb") as f:
+            np.save(f, vectors)
+    _atomic_write(output_path, write_npy)
+    print(f"Векторы запросов для {days} дат сохранены в '{output_path}' ({time.perf_counter() - started:.1f} с).")
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Инкрементальная сборка индекса FAISS по CSV с историческими событиями.")
+    parser.add_argument("--csv", default=CSV_FILE_PATH, help="Путь к CSV с событиями.")
+    parser.add_argument("--index", default=INDEX_LOAD_PATH, help="Папка индекса (index.faiss, index.pkl, manifest.json).")
+    parser.add_argument("--chunk-size", type=int, default=256, help="Сколько строк CSV читать за раз.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Размер пакета для модели эмбеддингов.")
+    parser.add_argument("--full", action="store_true", help="Пересобрать индекс с нуля.")
+    parser.add_argument("--query-vectors", action="store_true",
+                        help="Дополнительно предвычислить векторы запросов для всех дат календаря.")
+    args = parser.parse_args(argv)
+    build_index(args.csv, args.index, chunk_size=args.chunk_size, batch_size=args.batch_size, full=args.full)
+    if args.query_vectors:
+        build_query_vectors(os.path.join(args.index, os.path.basename(QUERY_VECTORS_PATH)), batch_size=args.batch_size)
+
+
+if __name__ == "__main__":
+    main()
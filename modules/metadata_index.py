@@ -0,0 +1,57 @@
+# modules/metadata_index.py
+from collections import defaultdict
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+from .date_index import parse_date
+
+
+class MetadataIndex:
+    """Инвертированные индексы по году (из metadata['date']), месту и категории.
+
+    Сужают множество кандидатов до поиска: и поиск по дате, и векторный поиск
+    работают только по id, прошедшим фильтр.
+    """
+
+    def __init__(self, items: Iterable[Tuple[Hashable, dict]]):
+        self._by_year: Dict[int, Set[Hashable]] = defaultdict(set)
+        self._by_location: Dict[str, Set[Hashable]] = defaultdict(set)
+        self._by_category: Dict[str, Set[Hashable]] = defaultdict(set)
+        for item_id, metadata in items:
+            event_date = parse_date(metadata.get("date", ""))
+            if event_date is not None:
+                self._by_year[event_date.year].add(item_id)
+            if metadata.get("location"):
+                self._by_location[metadata["location"]].add(item_id)
+            if metadata.get("category"):
+                self._by_category[metadata["category"]].add(item_id)
+
+    @property
+    def locations(self) -> List[str]:
+        return sorted(self._by_location)
+
+    @property
+    def categories(self) -> List[str]:
+        return sorted(self._by_category)
+
+    @property
+    def year_bounds(self) -> Optional[Tuple[int, int]]:
+        if not self._by_year:
+            return None
+        return min(self._by_year), max(self._by_year)
+
+    def candidates(self, year_range: Optional[Tuple[int, int]] = None, locations: Optional[Iterable[str]] = None,
+                   categories: Optional[Iterable[str]] = None) -> Optional[Set[Hashable]]:
+        """Возвращает множество id, подходящих под все заданные фильтры, или None, если фильтров нет."""
+        selected = []
+        if year_range is not None:
+            first, last = year_range
+            selected.append(set().union(*(ids for year, ids in self._by_year.items() if first <= year <= last)))
+        if locations:
+            selected.append(set().union(*(self._by_location.get(value, set()) for value in locations)))
+        if categories:
+            selected.append(set().union(*(self._by_category.get(value, set()) for value in categories)))
+        if not selected:
+            return None
+        # Пересекаем, начиная с самого маленького множества
+        selected.sort(key=len)
+        return selected[0].intersection(*selected[1:])
@@ -0,0 +1,202 @@
+# modules/mmap_store.py
+"""Векторное хранилище без pickle: матрица float32 (.npy, открывается через memory-map) + таблица документов JSONL.
+
+Несколько процессов на одной машине разделяют одну копию векторов в page cache, загрузка почти мгновенная.
+Конвертация из faiss_index_historical/: python -m modules.mmap_store [--src faiss_index_historical] [--dst vector_store_mmap]
+В meta.json записывается отпечаток исходного индекса FAISS: после его обновления (python -m modules.index_builder)
+хранилище считается устаревшим, пока его не сконвертируют заново.
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+# Папка хранилища (относительно корня проекта)
+MMAP_STORE_PATH = "vector_store_mmap"
+VECTORS_FILE = "vectors.npy"
+DOCUMENTS_FILE = "documents.jsonl"
+META_FILE = "meta.json"
+FORMAT_VERSION = 1
+# Манифест, который index_builder переписывает при каждой сборке индекса FAISS
+FAISS_MANIFEST_FILE = "manifest.json"
+
+
+class MmapVectorStore:
+    """Точный L2-поиск по матрице векторов, отображённой в память; интерфейс совместим с нужной нам частью FAISS."""
+
+    def __init__(self, vectors: np.ndarray, documents: List[Document], ids: List[str], embeddings=None):
+        if len(vectors) != len(documents):
+            raise ValueError(f"Число векторов ({len(vectors)}) не совпадает с числом документов ({len(documents)}).")
+        self.vectors = vectors
+        self.documents = documents
+        self.ids = ids
+        self.embeddings = embeddings
+        # Квадраты норм считаем один раз: на запрос остаётся одно умножение матрицы на вектор
+        self._norms = np.einsum("ij,ij->i", vectors, vectors)
+
+    @classmethod
+    def load(cls, folder_path: str = MMAP_STORE_PATH, embeddings=None) -> "MmapVectorStore":
+        """Открывает хранилище: векторы — через memory-map, документы — из JSONL (pickle не используется)."""
+        with open(os.path.join(folder_path, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Неподдерживаемая версия формата хранилища: {meta.get('version')}")
+        vectors = np.load(os.path.join(folder_path, VECTORS_FILE), mmap_mode="r")
+        documents, ids = [], []
+        with open(os.path.join(folder_path, DOCUMENTS_FILE), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                ids.append(record["id"])
+                documents.append(Document(page_content=record["page_content"], metadata=record["metadata"]))
+        return cls(vectors, documents, ids, embeddings)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def similarity_search_with_score_by_vector(self, embedding, k: int = 4, candidate_rows=None) -> List[Tuple[Document, float]]:
+        """Возвращает k ближайших документов и квадрат L2-расстояния (как IndexFlatL2).
+
+        candidate_rows — необязательный набор номеров строк: расстояния считаются только для них.
+        """
+        query = np.asarray(embedding, dtype=np.float32)
+        if candidate_rows is None:
+            rows = None
+            distances = self._norms - 2.0 * (self.vectors @ query) + float(query @ query)
+        else:
+            rows = np.fromiter(sorted(candidate_rows), dtype=np.int64)
+            distances = self._norms[rows] - 2.0 * (self.vectors[rows] @ query) + float(query @ query)
+        k = min(k, len(distances))
+        if k <= 0:
+            return []
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top], kind="stable")]
+        positions = top if rows is None else rows[top]
+        return [(self.documents[i], float(d)) for i, d in zip(positions.tolist(), distances[top].tolist())]
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, candidate_rows=None, **kwargs) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k=k, candidate_rows=candidate_rows)]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs) -> List[Document]:
+        if self.embeddings is None:
+            raise RuntimeError("Для поиска по тексту хранилищу нужна модель эмбеддингов.")
+        return self.similarity_search_by_vector(self.embeddings.embed_query(query), k=k)
+
+    def as_retriever(self, search_kwargs: Optional[dict] = None) -> "MmapRetriever":
+        """Ретривер с тем же интерфейсом, что и FAISS.as_retriever (invoke(query) -> List[Document])."""
+        k = (search_kwargs or {}).get("k", 4)
+        return MmapRetriever(vector_store=self, k=k)
+
+
+class MmapRetriever(BaseRetriever):
+    """Ретривер LangChain поверх MmapVectorStore."""
+
+    vector_store: Any
+    k: int = 4
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.vector_store.similarity_search(query, k=self.k)
+
+
+def faiss_fingerprint(src: str) -> Optional[str]:
+    """Отпечаток индекса FAISS: хэш manifest.json, а у индекса без манифеста — хэш index.faiss и index.pkl.
+
+    None — индекса в папке нет.
+    """
+    manifest_path = os.path.join(src, FAISS_MANIFEST_FILE)
+    names = [FAISS_MANIFEST_FILE] if os.path.exists(manifest_path) else ["index.faiss", "index.pkl"]
+    paths = [os.path.join(src, name) for name in names]
+    if not all(os.path.exists(path) for path in paths):
+        return None
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return f"{names[0]}:{digest.hexdigest()}"
+
+
+def is_stale(folder_path: str, faiss_dir: str) -> bool:
+    """True, если хранилище сконвертировано не из текущего индекса FAISS (или до того, как отпечаток стал записываться)."""
+    current = faiss_fingerprint(faiss_dir)
+    if current is None:
+        # Сравнивать не с чем: например, на сервер выложено только хранилище memory-map
+        return False
+    with open(os.path.join(folder_path, META_FILE), encoding="utf-8") as f:
+        meta = json.load(f)
+    return meta.get("source_fingerprint") != current
+
+
+def convert_faiss_dir(src: str, dst: str = MMAP_STORE_PATH) -> int:
+    """Конвертирует индекс FAISS (index.faiss + index.pkl) в формат memory-map. Возвращает число документов.
+
+    index.pkl читается через pickle один раз, офлайн, из доверенного источника — в рантайме pickle больше не нужен.
+    """
+    import pickle
+    import faiss
+
+    # Отпечаток снимается до чтения: если индекс обновят во время конвертации, хранилище окажется устаревшим
+    source_fingerprint = faiss_fingerprint(src)
+    index = faiss.read_index(os.path.join(src, "index.faiss"))
+    with open(os.path.join(src, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+
+    if isinstance(index, faiss.IndexIDMap2):
+        faiss_ids = faiss.vector_to_array(index.id_map).tolist()
+        vectors = index.index.reconstruct_n(0, index.ntotal)
+    else:
+        faiss_ids = list(range(index.ntotal))
+        vectors = index.reconstruct_n(0, index.ntotal)
+
+    # Пишем во временную папку рядом и подменяем целиком: читатели не увидят наполовину записанное хранилище
+    parent = os.path.dirname(os.path.abspath(dst))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".tmp_mmap_store_")
+    try:
+        np.save(os.path.join(tmp_dir, VECTORS_FILE), np.ascontiguousarray(vectors, dtype=np.float32))
+        with open(os.path.join(tmp_dir, DOCUMENTS_FILE), "w", encoding="utf-8") as f:
+            for faiss_id in faiss_ids:
+                docstore_id = index_to_docstore_id[faiss_id]
+                doc = docstore.search(docstore_id)
+                record = {"id": docstore_id, "page_content": doc.page_content, "metadata": doc.metadata}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "dimension": int(vectors.shape[1]), "count": len(faiss_ids),
+                       "metric": "l2", "source": os.path.abspath(src), "source_fingerprint": source_fingerprint},
+                      f, ensure_ascii=False)
+        os.chmod(tmp_dir, 0o755)
+
+        backup_dir = None
+        if os.path.exists(dst):
+            backup_dir = tempfile.mkdtemp(dir=parent, prefix=".old_mmap_store_")
+            os.rmdir(backup_dir)
+            os.replace(dst, backup_dir)
+        os.replace(tmp_dir, dst)
+        if backup_dir:
+            shutil.rmtree(backup_dir, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    print(f"Хранилище memory-map записано в '{dst}': {len(faiss_ids)} документов, размерность {vectors.shape[1]}.")
+    return len(faiss_ids)
+
+
+def main(argv=None) -> None:
+    from .rag import INDEX_LOAD_PATH
+
+    parser = argparse.ArgumentParser(description="Конвертация индекса FAISS в формат memory-map без pickle.")
+    parser.add_argument("--src", default=INDEX_LOAD_PATH, help="Папка с index.faiss и index.pkl.")
+    parser.add_argument("--dst", default=MMAP_STORE_PATH, help="Папка для хранилища memory-map.")
+    args = parser.parse_args(argv)
+    convert_faiss_dir(args.src, args.dst)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+# modules/neighbours.py
+"""Предвычисленная таблица соседей по дате: для каждого дня календаря — N ближайших событий.
+
+Даты в интерфейсе — конечный набор (CALENDAR_START..CALENDAR_END), а корпус меняется редко, поэтому
+поиск по индексу дат выполняется заранее для всех дней сразу. Таблица — два массива [дней × N]:
+ids.npy (int32, позиции документов в DateIndex, -1 — пусто) и scores.npy (float32, расстояние в днях,
+по строке не убывает). Запрос к календарной дате — срез строки, открытой через memory-map.
+
+meta.json хранит отпечаток источника индекса дат (хэш CSV или манифеста индекса): если данные
+изменились, таблица пересобирается при первом обращении. Заранее: python -m modules.neighbours
+"""
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import List, Optional
+
+import numpy as np
+
+from .date_index import CALENDAR_END, CALENDAR_START, DateIndex
+
+# Сколько соседей хранится на дату (запросы с большим k идут мимо таблицы)
+NEIGHBOUR_TABLE_K = int(os.getenv("NEIGHBOUR_TABLE_K", "16"))
+TABLE_VERSION = 1
+_ARRAYS = ("ids", "scores")
+
+
+def file_fingerprint(path: str) -> str:
+    """Хэш содержимого файла — отпечаток данных, по которым строилась таблица."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"{os.path.basename(path)}:{digest.hexdigest()}"
+
+
+class NeighbourTable:
+    """Ближайшие по дате события для каждого дня календаря (массивы ids и scores)."""
+
+    def __init__(self, ids: np.ndarray, scores: np.ndarray, meta: dict):
+        self.ids = ids
+        self.scores = scores
+        self.meta = meta
+        self.start = datetime.date.fromisoformat(meta["calendar_start"])
+
+    @property
+    def k(self) -> int:
+        return self.ids.shape[1]
+
+    def lookup(self, target_date: datetime.date, k: int, window_days: Optional[int] = None, allowed=None) -> Optional[List[int]]:
+        """Позиции k ближайших событий в DateIndex — те же, что вернул бы DateIndex.search.
+
+        None — таблица не может ответить точно: дата вне календаря, k больше N или фильтр allowed
+        оставил в строке меньше k событий, а дальше строки таблица не знает.
+        """
+        day = (target_date - self.start).days
+        if not 0 <= day < len(self.ids) or k > self.k:
+            return None
+        row_ids, row_scores = self.ids[day], self.scores[day]
+        # Расстояния по строке не убывают, а пустые ячейки (inf) стоят в конце: окно — бинарный поиск
+        limit = np.inf if window_days is None else window_days
+        end = int(np.searchsorted(row_scores, limit, side="right" if window_days is not None else "left"))
+        if allowed is None:
+            return row_ids[:min(k, end)].tolist()
+        found = [position for position in row_ids[:end].tolist() if position in allowed][:k]
+        # Строку обрезало окно или в ней кончились события — результат полный; иначе соседи могли быть дальше N
+        if len(found) == k or end < self.k:
+            return found
+        return None
+
+    def save(self, folder_path: str) -> None:
+        """Атомарно записывает ids.npy, scores.npy и последним meta.json (без него таблица считается недописанной)."""
+        os.makedirs(folder_path, exist_ok=True)
+        for name, array in zip(_ARRAYS, (self.ids, self.scores)):
+            _replace_atomically(os.path.join(folder_path, f"{name}.npy"), lambda f, a=array: np.save(f, a))
+        _replace_atomically(os.path.join(folder_path, "meta.json"),
+                            lambda f: f.write(json.dumps(self.meta, ensure_ascii=False, indent=2).encode("utf-8")))
+
+    @classmethod
+    def load(cls, folder_path: str) -> "NeighbourTable":
+        with open(os.path.join(folder_path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        # memory-map: страницы таблицы делят все процессы сервиса через page cache
+        ids, scores = (np.load(os.path.join(folder_path, f"{name}.npy"), mmap_mode="r") for name in _ARRAYS)
+        return cls(ids, scores, meta)
+
+
+def _replace_atomically(path: str, write) -> None:
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def build_neighbour_table(date_index: DateIndex, fingerprint: str, k: int = NEIGHBOUR_TABLE_K,
+                          start: datetime.date = CALENDAR_START, end: datetime.date = CALENDAR_END) -> NeighbourTable:
+    """Считает k ближайших событий для каждого дня [start, end] одним проходом по индексу дат."""
+    days = (end - start).days + 1
+    calendar = [start + datetime.timedelta(days=i) for i in range(days)]
+    ids = np.full((days, k), -1, dtype=np.int32)
+    scores = np.full((days, k), np.inf, dtype=np.float32)
+    for day, found in enumerate(date_index.positions_many(calendar, k=k)):
+        for column, (position, distance) in enumerate(found):
+            ids[day, column] = position
+            scores[day, column] = distance
+    meta = {
+        "version": TABLE_VERSION,
+        "fingerprint": fingerprint,
+        "k": k,
+        "calendar_start": start.isoformat(),
+        "calendar_end": end.isoformat(),
+        "documents": len(date_index),
+    }
+    return NeighbourTable(ids, scores, meta)
+
+
+def load_or_build_table(folder_path: str, date_index: DateIndex, fingerprint: str, k: int = NEIGHBOUR_TABLE_K) -> NeighbourTable:
+    """Открывает сохранённую таблицу, если она построена по тем же данным; иначе пересобирает и сохраняет."""
+    expected = {
+        "version": TABLE_VERSION,
+        "fingerprint": fingerprint,
+        "k": k,
+        "calendar_start": CALENDAR_START.isoformat(),
+        "calendar_end": CALENDAR_END.isoformat(),
+        "documents": len(date_index),
+    }
+    try:
+        table = NeighbourTable.load(folder_path)
+        if all(table.meta.get(key) == value for key, value in expected.items()) and table.ids.shape == table.scores.shape:
+            return table
+        print(f"Таблица соседей в '{folder_path}' построена по другим данным, пересобираем...")
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Таблица соседей в '{folder_path}' не найдена или повреждена ({e}), строим...")
+    started = time.perf_counter()
+    table = build_neighbour_table(date_index, fingerprint, k)
+    try:
+        table.save(folder_path)
+    except OSError as e:
+        # Например, папка индекса только для чтения: таблица остаётся в памяти процесса
+        print(f"Не удалось сохранить таблицу соседей в '{folder_path}': {e}")
+    print(f"Таблица соседей: {len(table.ids)} дат x {k} событий ({time.perf_counter() - started:.2f} с).")
+    return table
+
+
+def main(argv=None) -> None:
+    from . import rag
+
+    parser = argparse.ArgumentParser(description="Предвычисление ближайших событий для всех дат календаря.")
+    parser.add_argument("--output", default=rag.NEIGHBOUR_TABLE_PATH, help="Папка таблицы (ids.npy, scores.npy, meta.json).")
+    parser.add_argument("--k", type=int, default=NEIGHBOUR_TABLE_K, help="Сколько соседей хранить на дату.")
+    parser.add_argument("--force", action="store_true", help="Пересобрать, даже если таблица актуальна.")
+    args = parser.parse_args(argv)
+    date_index = rag.get_date_index()
+    fingerprint = file_fingerprint(rag.date_index_source())
+    if args.force:
+        build_neighbour_table(date_index, fingerprint, args.k).save(args.output)
+        print(f"Таблица соседей сохранена в '{args.output}'.")
+    else:
+        table = load_or_build_table(args.output, date_index, fingerprint, args.k)
+        print(f"Таблица соседей в '{args.output}' актуальна: {len(table.ids)} дат x {table.k} событий.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# modules/parsing.py
+import json
+import re
+from typing import List, Tuple
+
+from pydantic import ValidationError
+
+from .models import NewsArticle, NewsReport
+
+_CODE_FENCE = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+
+
+def strip_code_fences(text: str) -> str:
+    """Убирает обёртку ```json ... ``` (в том числе незакрытую, если ответ оборван)."""
+    match = _CODE_FENCE.search(text)
+    return match.group(1) if match else text
+
+
+def strip_trailing_commas(text: str) -> str:
+    """Удаляет висячие запятые перед } и ] (вне строк) — частая ошибка LLM в JSON."""
+    out = []
+    in_string = escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "}]":
+            j = len(out) - 1
+            while j >= 0 and out[j].isspace():
+                j -= 1
+            if j >= 0 and out[j] == ",":
+                del out[j]
+        out.append(ch)
+    return "".join(out)
+
+
+class ArticleStreamParser:
+    """Инкрементальный разбор потока токенов LLM: отдаёт NewsArticle, как только объект в массиве "articles" закрыт.
+
+    Буфер просматривается один раз: состояние (глубина вложенности, строка, экранирование)
+    сохраняется между вызовами feed, поэтому разбор всего ответа линеен по его длине.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self._pos = 0 # Позиция, до которой буфер уже просмотрен
+        self._array_start = None # Индекс "[" массива articles
+        self._depth = 0 # Глубина вложенности внутри массива (1 — внутри объекта статьи)
+        self._object_start = None
+        self._in_string = False
+        self._escaped = False
+        self._done = False
+        self.skipped = 0 # Сколько закрытых объектов не прошли валидацию
+
+    @property
+    def complete(self) -> bool:
+        """True, если массив articles в ответе уже закрыт."""
+        return self._done
+
+    def _find_array_start(self) -> bool:
+        key_pos = self.buffer.find('"articles"')
+        if key_pos == -1:
+            return False
+        bracket_pos = self.buffer.find("[", key_pos)
+        if bracket_pos == -1:
+            return False
+        self._array_start = bracket_pos
+        self._pos = bracket_pos + 1
+        return True
+
+    def feed(self, chunk: str) -> List[NewsArticle]:
+        """Добавляет очередной фрагмент ответа и возвращает статьи, завершённые в нём."""
+        self.buffer += chunk
+        if self._done or (self._array_start is None and not self._find_array_start()):
+            return []
+
+        articles = []
+        buffer = self.buffer
+        for i in range(self._pos, len(buffer)):
+            ch = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0:
+                    # Закрылся сам массив articles — дальше статей не будет
+                    self._done = True
+                    self._pos = i + 1
+                    return articles
+                self._depth -= 1
+                if self._depth == 0 and self._object_start is not None:
+                    article = self._parse_article(buffer[self._object_start:i + 1])
+                    if article is not None:
+                        articles.append(article)
+                    else:
+                        self.skipped += 1
+                    self._object_start = None
+        self._pos = len(buffer)
+        return articles
+
+    @staticmethod
+    def _parse_article(fragment: str):
+        try:
+            try:
+                data = json.loads(fragment)
+            except json.JSONDecodeError:
+                data = json.loads(strip_trailing_commas(fragment))
+            return NewsArticle.model_validate(data)
+        except (json.JSONDecodeError, ValidationError) as e:
+            print(f"Пропущена некорректная статья в потоке: {e}")
+            return None
+
+
+def salvage_articles(text: str) -> Tuple[List[NewsArticle], bool, int]:
+    """Достаёт из сырого ответа LLM все полностью сформированные статьи.
+
+    Снимает ```-ограду и висячие запятые; если ответ оборван, берёт статьи, закрытые до обрыва.
+    Возвращает (статьи, закрыт ли массив articles, число отброшенных некорректных статей).
+    """
+    text = strip_code_fences(text)
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        try:
+            report = NewsReport.model_validate(json.loads(strip_trailing_commas(text[start:end + 1])))
+            return list(report.articles), True, 0
+        except (json.JSONDecodeError, ValidationError):
+            pass
+    # Целиком не разбирается — собираем статьи по одной тем же сканером, что и в потоковом режиме
+    if '"articles"' not in text and text.lstrip().startswith("["):
+        text = '{"articles": ' + text.lstrip() # Модель вернула голый массив статей
+    parser = ArticleStreamParser()
+    articles = parser.feed(text)
+    return articles, parser.complete, parser.skipped
@@ -0,0 +1,207 @@
+# modules/prompt_budget.py
+"""Бюджет промпта: короче контекст и схема ответа — меньше входных токенов, ниже задержка и цена выпуска.
+
+Контекст собирается из найденных событий так:
+  * почти одинаковые события (совпадает большая часть слов описания) остаются в одном экземпляре;
+  * длинное описание обрезается по границе предложения или слова до EVENT_TOKEN_BUDGET токенов;
+  * события в порядке выдачи поиска добавляются, пока контекст укладывается в CONTEXT_TOKEN_BUDGET.
+Вместо многословной JSON-схемы PydanticOutputParser в промпт идёт компактный образец ответа.
+"""
+import functools
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from typing import Optional, Tuple
+
+from pydantic import BaseModel
+
+from .models import NewsReport
+
+# Бюджеты в токенах (0 — без ограничения)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1000"))
+EVENT_TOKEN_BUDGET = int(os.getenv("EVENT_TOKEN_BUDGET", "80"))
+# Доля общих слов, начиная с которой два описания считаются одним событием
+DEDUPE_THRESHOLD = float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+# Кодировка токенизатора gpt-4o; без tiktoken (или без её файла в локальном кэше) токены оцениваются по символам
+TOKENIZER_ENCODING = "o200k_base"
+TOKENIZER_URL = "https://openaipublic.blob.core.windows.net/encodings/o200k_base.tiktoken"
+# Разрешить tiktoken скачать кодировку, если её нет в кэше (TIKTOKEN_CACHE_DIR); по умолчанию сеть не трогаем
+TOKENIZER_DOWNLOAD = os.getenv("TOKENIZER_DOWNLOAD", "0") == "1"
+CHARS_PER_TOKEN = 3 # Грубая оценка для смешанного русского текста
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"[.!?…](?=\s)")
+
+
+_encoding = None
+_encoding_loaded = False
+_encoding_lock = threading.Lock()
+
+
+def _tiktoken_cache_path() -> Optional[str]:
+    """Файл, в котором tiktoken хранит скачанную кодировку (та же логика, что в tiktoken.load)."""
+    cache_dir = os.environ.get("TIKTOKEN_CACHE_DIR", os.environ.get(
+        "DATA_GYM_CACHE_DIR", os.path.join(tempfile.gettempdir(), "data-gym-cache")))
+    if not cache_dir:
+        return None
+    return os.path.join(cache_dir, hashlib.sha1(TOKENIZER_URL.encode()).hexdigest())
+
+
+def load_tokenizer():
+    """Загружает кодировку tiktoken один раз на процесс; возвращает её или None (тогда оценка по символам).
+
+    Вызывается при старте сервиса (service.preload) или при первом подсчёте токенов. Без TOKENIZER_DOWNLOAD=1
+    кодировка берётся только из локального кэша tiktoken: скачивание без таймаута не должно подвесить
+    первый запрос на хосте без выхода в сеть.
+    """
+    global _encoding, _encoding_loaded
+    if _encoding_loaded:
+        return _encoding
+    with _encoding_lock:
+        if _encoding_loaded:
+            return _encoding
+        try:
+            import tiktoken
+            cache_path = _tiktoken_cache_path()
+            if TOKENIZER_DOWNLOAD or (cache_path is not None and os.path.exists(cache_path)):
+                _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+            else:
+                print(f"Кодировки {TOKENIZER_ENCODING} нет в кэше tiktoken, токены оцениваются по числу символов "
+                      f"(TOKENIZER_DOWNLOAD=1 — скачать).")
+        except Exception as e:
+            print(f"Токенизатор tiktoken недоступен, токены оцениваются по числу символов: {e}")
+        _encoding_loaded = True
+        return _encoding
+
+
+def estimate_tokens(text: str) -> int:
+    """Число токенов текста (точное через tiktoken, иначе оценка по символам)."""
+    if not text:
+        return 0
+    encoding = load_tokenizer()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Обрезает текст до max_tokens по границе предложения (или хотя бы слова), добавляя «…»."""
+    if max_tokens <= 0 or estimate_tokens(text) <= max_tokens:
+        return text
+    words = text.split()
+    # Бинарный поиск наибольшего числа слов, которое вместе с «…» укладывается в бюджет
+    low, high = 0, len(words)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(" ".join(words[:middle]) + "…") <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    truncated = " ".join(words[:max(low, 1)])
+    # Если во второй половине обрезка есть конец предложения — режем по нему
+    sentence_ends = [m.end() for m in _SENTENCE_END.finditer(truncated + " ")]
+    if sentence_ends and sentence_ends[-1] > len(truncated) // 2:
+        return truncated[:sentence_ends[-1]]
+    return truncated.rstrip(",;:—-– ") + "…"
+
+
+def _event_description(doc) -> Optional[str]:
+    """Описание события из page_content (формат row_to_document); None, если формат другой."""
+    text, metadata = doc.page_content, doc.metadata
+    prefix = f"Дата: {metadata.get('date')}. Событие: "
+    if not text.startswith(prefix):
+        return None
+    description = text[len(prefix):]
+    for key, label in (("category", "Категория"), ("location", "Место")):
+        suffix = f". {label}: {metadata[key]}" if metadata.get(key) else ""
+        if suffix and description.endswith(suffix):
+            description = description[:-len(suffix)]
+    return description
+
+
+def _word_set(text: str) -> frozenset:
+    return frozenset(word.lower() for word in _WORD.findall(text))
+
+
+def dedupe_documents(docs, threshold: float = DEDUPE_THRESHOLD) -> list:
+    """Убирает почти одинаковые события (сходство Жаккара по словам описания ≥ threshold), сохраняя порядок."""
+    kept, kept_words = [], []
+    for doc in docs:
+        words = _word_set(_event_description(doc) or doc.page_content)
+        duplicate = any(
+            words == other or (words and other and len(words & other) / len(words | other) >= threshold)
+            for other in kept_words
+        )
+        if not duplicate:
+            kept.append(doc)
+            kept_words.append(words)
+    return kept
+
+
+def format_event(doc, max_tokens: int = EVENT_TOKEN_BUDGET) -> str:
+    """Компактная строка события: «дата — описание (место; категория)» с описанием в пределах бюджета."""
+    description = _event_description(doc)
+    if description is None:
+        return truncate_to_tokens(doc.page_content, max_tokens)
+    details = "; ".join(doc.metadata[key] for key in ("location", "category") if doc.metadata.get(key))
+    line = f"{doc.metadata['date']} — {truncate_to_tokens(description.rstrip('. '), max_tokens)}"
+    return f"{line} ({details})" if details else line
+
+
+def build_budgeted_context(docs, max_tokens: int = CONTEXT_TOKEN_BUDGET, event_tokens: int = EVENT_TOKEN_BUDGET,
+                           threshold: float = DEDUPE_THRESHOLD) -> Tuple[str, dict]:
+    """Собирает контекст в пределах бюджета токенов.
+
+    Возвращает (контекст, статистика): сколько событий найдено, убрано дублей, обрезано и отброшено
+    по бюджету, а также токены контекста до и после (до — при склейке полных page_content).
+    """
+    full_tokens = estimate_tokens("\n\n".join(doc.page_content for doc in docs))
+    unique_docs = dedupe_documents(docs, threshold)
+    lines, truncated, context_tokens = [], 0, 0
+    for doc in unique_docs:
+        line = format_event(doc, event_tokens)
+        line_tokens = estimate_tokens(line)
+        # Хотя бы одно событие попадает в контекст всегда
+        if lines and max_tokens > 0 and context_tokens + line_tokens > max_tokens:
+            break
+        lines.append(line)
+        truncated += event_tokens > 0 and estimate_tokens(_event_description(doc) or doc.page_content) > event_tokens
+        context_tokens += line_tokens
+    context = "\n".join(lines)
+    context_tokens = estimate_tokens(context)
+    stats = {
+        "docs": len(docs),
+        "duplicates": len(docs) - len(unique_docs),
+        "truncated": truncated,
+        "dropped": len(unique_docs) - len(lines),
+        "tokens_full": full_tokens,
+        "tokens": context_tokens,
+        "tokens_saved": max(full_tokens - context_tokens, 0),
+    }
+    return context, stats
+
+
+@functools.lru_cache(maxsize=None)
+def compact_format_instructions(model: type = NewsReport) -> str:
+    """Компактный образец JSON-ответа из описаний полей модели: без $defs, title, type и вступления парсера."""
+    def skeleton(model_cls: type) -> dict:
+        result = {}
+        for name, field in model_cls.model_fields.items():
+            item_type = (getattr(field.annotation, "__args__", None) or (None,))[0]
+            if isinstance(item_type, type) and issubclass(item_type, BaseModel):
+                result[name] = [skeleton(item_type)]
+            else:
+                result[name] = field.description or name
+        return result
+
+    example = json.dumps(skeleton(model), ensure_ascii=False)
+    return f"{example}\nВсе поля обязательны, значения — строки; в образце вместо значений указано, что в них писать."
+
+
+@functools.lru_cache(maxsize=None)
+def schema_tokens_saved(full_instructions: str, compact_instructions: str) -> int:
+    """Сколько токенов экономит компактная схема на каждом запросе к LLM."""
+    return max(estimate_tokens(full_instructions) - estimate_tokens(compact_instructions), 0)
@@ -1,10 +1,22 @@
 # modules/rag.py
-import streamlit as st
+import functools
 from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import HuggingFaceEmbeddings
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.retrievers import BaseRetriever
 import os
+import threading
+from typing import Any, List, Set
+import numpy as np
 from dotenv import load_dotenv
 
+from .date_index import CALENDAR_END, CALENDAR_START, DATE_DISPLAY_FORMAT, DateIndex, parse_date
+from .events import CSV_FILE_PATH, load_documents_from_csv
+from .metadata_index import MetadataIndex
+from .mmap_store import MMAP_STORE_PATH, MmapVectorStore, is_stale
+from .neighbours import file_fingerprint, load_or_build_table
+
 load_dotenv()
 
 # --- Константы ---
@@ -13,42 +25,133 @@ INDEX_LOAD_PATH = "faiss_index_historical"
 # Имя модели эмбеддингов, которая использовалась для СОЗДАНИЯ индекса
 # Оно нужно для корректной ЗАГРУЗКИ индекса
 EMBEDDING_MODEL_NAME = "sentence-transformers/paraphrase-multilingual-mpnet-base-v2"
+# Формат хранилища: "faiss" (index.faiss + index.pkl), "mmap" (vector_store_mmap/, без pickle)
+# или "auto" — mmap, если папка сконвертирована из текущего индекса FAISS, иначе faiss
+VECTOR_STORE_FORMAT = os.getenv("VECTOR_STORE_FORMAT", "auto")
+
+# Предвычисленные векторы запросов "События около <дата>" для каждой даты календаря (float16, строка = день)
+QUERY_VECTORS_PATH = os.path.join(INDEX_LOAD_PATH, "date_query_vectors.npy")
+# Предвычисленные ближайшие по дате события для каждого дня календаря (см. neighbours.py); NEIGHBOUR_TABLE=0 — не использовать
+NEIGHBOUR_TABLE_PATH = os.path.join(INDEX_LOAD_PATH, "date_neighbours")
+USE_NEIGHBOUR_TABLE = os.getenv("NEIGHBOUR_TABLE", "1") != "0"
+
+
+class LazyEmbeddings(Embeddings):
+    """Модель эмбеддингов, которая загружается только при первом реальном запросе на эмбеддинг.
+
+    FAISS.load_local требует объект эмбеддингов, но для поиска по дате и по предвычисленным
+    векторам сама модель (сотни МБ и импорт torch) не нужна.
+    """
+
+    def __init__(self, model_name: str = EMBEDDING_MODEL_NAME):
+        self.model_name = model_name
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._model is not None
 
-# Используем кэширование Streamlit для загрузки модели и индекса
-@st.cache_resource
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    from langchain_community.embeddings import HuggingFaceEmbeddings
+                    print(f"Загрузка модели эмбеддингов '{self.model_name}' (первый текстовый запрос)...")
+                    self._model = HuggingFaceEmbeddings(model_name=self.model_name)
+                    print("Модель эмбеддингов загружена.")
+        return self._model
+
+    def embed_documents(self, texts):
+        return self._get_model().embed_documents(texts)
+
+    def embed_query(self, text):
+        return self._get_model().embed_query(text)
+
+
+# Модель и индексы загружаются один раз на процесс (без Streamlit: тот же код работает в HTTP-сервисе и пакетных задачах)
+@functools.lru_cache(maxsize=1)
 def get_embeddings_loader():
-    """Загружает ТОЛЬКО модель эмбеддингов (нужна для FAISS.load_local)."""
-    print("Инициализация модели эмбеддингов для загрузки индекса...")
-    try:
-        # Модель нужна для FAISS.load_local, но не для генерации эмбеддингов на лету
-        embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-        print("Модель эмбеддингов загружена.")
-        return embeddings
-    except Exception as e:
-        st.error(f"Не удалось загрузить модель эмбеддингов '{EMBEDDING_MODEL_NAME}': {e}")
-        print(f"Полная ошибка загрузки эмбеддингов: {e}")
+    """Возвращает ленивую обёртку над моделью эмбеддингов (нужна для FAISS.load_local)."""
+    # Сама модель загрузится только тогда, когда понадобится эмбеддинг свободного текста
+    return LazyEmbeddings(EMBEDDING_MODEL_NAME)
+
+@functools.lru_cache(maxsize=1)
+def get_query_vectors():
+    """Открывает предвычисленные векторы запросов по датам (memory-map), или None, если файла нет."""
+    if not os.path.exists(QUERY_VECTORS_PATH):
         return None
+    vectors = np.load(QUERY_VECTORS_PATH, mmap_mode="r")
+    expected_rows = (CALENDAR_END - CALENDAR_START).days + 1
+    if vectors.ndim != 2 or vectors.shape[0] != expected_rows:
+        print(f"Файл '{QUERY_VECTORS_PATH}' не соответствует календарю ({vectors.shape}), игнорируем его.")
+        return None
+    print(f"Предвычисленные векторы запросов загружены: {vectors.shape[0]} дат.")
+    return vectors
+
+def semantic_query(target_date) -> str:
+    """Текст запроса для семантического поиска по дате."""
+    parsed = parse_date(target_date)
+    date_text = parsed.strftime(DATE_DISPLAY_FORMAT) if parsed else target_date
+    return f"События около {date_text}"
 
-@st.cache_resource
+@functools.lru_cache(maxsize=1)
 def get_vector_store():
-    """Загружает предсозданный индекс FAISS (кэшируется)."""
+    """Загружает векторное хранилище (кэшируется): memory-map без pickle или предсозданный индекс FAISS."""
+    if _use_mmap_store():
+        return _load_mmap_store()
+    return _load_faiss_store()
+
+@functools.lru_cache(maxsize=1)
+def _use_mmap_store() -> bool:
+    """Читать ли хранилище memory-map вместо FAISS (решение принимается один раз на процесс)."""
+    if VECTOR_STORE_FORMAT != "mmap" and not (
+        VECTOR_STORE_FORMAT == "auto" and os.path.exists(os.path.join(MMAP_STORE_PATH, "meta.json"))
+    ):
+        return False
+    try:
+        stale = is_stale(MMAP_STORE_PATH, INDEX_LOAD_PATH)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось сверить хранилище memory-map с индексом FAISS: {e}")
+        stale = True
+    if not stale:
+        return True
+    # После обновления индекса (python -m modules.index_builder) векторы memory-map остаются старыми
+    hint = f"Сконвертируйте заново: python -m modules.mmap_store --src {INDEX_LOAD_PATH} --dst {MMAP_STORE_PATH}"
+    if VECTOR_STORE_FORMAT == "mmap":
+        print(f"Хранилище memory-map '{MMAP_STORE_PATH}' устарело относительно индекса FAISS, но выбрано явно. {hint}")
+        return True
+    print(f"Хранилище memory-map '{MMAP_STORE_PATH}' устарело относительно индекса FAISS, используем FAISS. {hint}")
+    return False
+
+def _load_mmap_store():
+    """Открывает хранилище memory-map: векторы разделяются между процессами через page cache."""
+    print(f"Попытка открытия хранилища memory-map из папки: {MMAP_STORE_PATH}...")
+    try:
+        vector_store = MmapVectorStore.load(MMAP_STORE_PATH, embeddings=get_embeddings_loader())
+        print(f"Хранилище memory-map открыто: {len(vector_store)} документов.")
+        return vector_store
+    except Exception as e:
+        print(f"Полная ошибка при открытии хранилища memory-map: {e}")
+        raise RuntimeError(f"Не удалось открыть хранилище memory-map из '{MMAP_STORE_PATH}': {e}") from e
+
+def _load_faiss_store():
+    """Загружает предсозданный индекс FAISS."""
     print(f"Попытка загрузки индекса FAISS из папки: {INDEX_LOAD_PATH}...")
     embeddings = get_embeddings_loader()
+    # Ошибки загрузки не показываются здесь, а пробрасываются: их выводит вызывающий код (UI, сервис, пакетный прогон)
     if embeddings is None:
-        st.error("Векторное хранилище не может быть загружено без модели эмбеддингов.")
-        return None
+        raise RuntimeError("Векторное хранилище не может быть загружено без модели эмбеддингов.")
 
     if not os.path.exists(INDEX_LOAD_PATH):
-         st.error(f"Ошибка: Папка с индексом FAISS не найдена по пути: '{INDEX_LOAD_PATH}'. Убедитесь, что она существует и содержит файлы 'index.faiss' и 'index.pkl'.")
          print(f"Ошибка FileNotFoundError при загрузке vector_store: папка '{INDEX_LOAD_PATH}' не найдена.")
-         return None
+         raise RuntimeError(f"Ошибка: Папка с индексом FAISS не найдена по пути: '{INDEX_LOAD_PATH}'. Убедитесь, что она существует и содержит файлы 'index.faiss' и 'index.pkl'.")
     # Проверим наличие файлов внутри папки
     faiss_file = os.path.join(INDEX_LOAD_PATH, "index.faiss")
     pkl_file = os.path.join(INDEX_LOAD_PATH, "index.pkl")
     if not os.path.exists(faiss_file) or not os.path.exists(pkl_file):
-        st.error(f"Ошибка: В папке '{INDEX_LOAD_PATH}' отсутствуют необходимые файлы 'index.faiss' или 'index.pkl'.")
         print(f"Ошибка: Не найдены index.faiss или index.pkl в '{INDEX_LOAD_PATH}'")
-        return None
+        raise RuntimeError(f"Ошибка: В папке '{INDEX_LOAD_PATH}' отсутствуют необходимые файлы 'index.faiss' или 'index.pkl'.")
 
     try:
         # Загружаем индекс с диска
@@ -61,18 +164,181 @@ def get_vector_store():
         print("Предсозданный индекс FAISS успешно загружен.")
         return vector_store
     except Exception as e:
-        st.error(f"Неожиданная ошибка при загрузке индекса FAISS из '{INDEX_LOAD_PATH}': {e}")
         print(f"Полная ошибка при загрузке vector_store: {e}")
-        return None
+        raise RuntimeError(f"Неожиданная ошибка при загрузке индекса FAISS из '{INDEX_LOAD_PATH}': {e}") from e
+
+def get_retriever(k=5, year_range=None, locations=None, categories=None):
+    """Возвращает настроенный ретривер из загруженного векторного хранилища.
 
-def get_retriever(k=5):
-    """Возвращает настроенный ретривер из загруженного векторного хранилища."""
+    Необязательные фильтры (диапазон лет, места, категории) сужают набор кандидатов до векторного поиска.
+    """
     vector_store = get_vector_store()
     if vector_store is None:
         raise RuntimeError("Векторное хранилище для RAG не инициализировано.")
 
+    candidate_ids = get_vector_metadata_index().candidates(year_range, locations, categories)
+    if candidate_ids is not None:
+        return FilteredRetriever(vector_store=vector_store, candidate_ids=candidate_ids, k=k)
     return vector_store.as_retriever(search_kwargs={"k": k})
 
+@functools.lru_cache(maxsize=1)
+def get_vector_metadata_index():
+    """Инвертированные индексы метаданных по id векторного хранилища (id FAISS или строка memory-map)."""
+    vector_store = get_vector_store()
+    if vector_store is None:
+        raise RuntimeError("Векторное хранилище для RAG не инициализировано.")
+    if isinstance(vector_store, MmapVectorStore):
+        return MetadataIndex((row, doc.metadata) for row, doc in enumerate(vector_store.documents))
+    items = []
+    for faiss_id, docstore_id in vector_store.index_to_docstore_id.items():
+        doc = vector_store.docstore.search(docstore_id)
+        if isinstance(doc, Document):
+            items.append((faiss_id, doc.metadata))
+    return MetadataIndex(items)
+
+def similarity_search_by_vector_filtered(vector_store, embedding, k: int, candidate_ids):
+    """Векторный поиск только среди candidate_ids (пустое множество — пустой результат)."""
+    if not candidate_ids:
+        return []
+    if isinstance(vector_store, MmapVectorStore):
+        return vector_store.similarity_search_by_vector(embedding, k=k, candidate_rows=candidate_ids)
+    import faiss
+    # Селектор id: FAISS считает расстояния только для кандидатов
+    selector = faiss.IDSelectorBatch(np.fromiter(candidate_ids, dtype=np.int64))
+    query = np.asarray([embedding], dtype=np.float32)
+    _, labels = vector_store.index.search(query, min(k, len(candidate_ids)), params=faiss.SearchParameters(sel=selector))
+    docs = []
+    for label in labels[0].tolist():
+        if label == -1:
+            continue
+        doc = vector_store.docstore.search(vector_store.index_to_docstore_id[label])
+        if isinstance(doc, Document):
+            docs.append(doc)
+    return docs
+
+class FilteredRetriever(BaseRetriever):
+    """Ретривер, который ищет ближайшие векторы только среди заранее отфильтрованных по метаданным id."""
+
+    vector_store: Any
+    candidate_ids: Set[int]
+    k: int = 5
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        # Фильтр ничего не оставил — модель эмбеддингов ради пустого ответа не загружаем
+        if not self.candidate_ids:
+            return []
+        embedding = get_embeddings_loader().embed_query(query)
+        return similarity_search_by_vector_filtered(self.vector_store, embedding, self.k, self.candidate_ids)
+
+@functools.lru_cache(maxsize=1)
+def get_date_index():
+    """Строит индекс событий по дате (кэшируется). Модель эмбеддингов для этого не нужна."""
+    if os.path.exists(CSV_FILE_PATH):
+        return DateIndex(load_documents_from_csv(CSV_FILE_PATH))
+    # Если CSV нет рядом с приложением, берём даты из метаданных загруженного индекса FAISS
+    print(f"CSV '{CSV_FILE_PATH}' не найден, индекс дат строится по метаданным FAISS.")
+    vector_store = get_vector_store()
+    if vector_store is None:
+        raise RuntimeError("Индекс дат не может быть построен: нет ни CSV, ни векторного хранилища.")
+    return DateIndex.from_vector_store(vector_store)
+
+@functools.lru_cache(maxsize=1)
+def get_date_metadata_index():
+    """Инвертированные индексы метаданных по позициям документов в индексе дат."""
+    return MetadataIndex((position, doc.metadata) for position, doc in enumerate(get_date_index().documents))
+
+def date_index_source() -> str:
+    """Файл, по которому строится индекс дат: CSV, а без него — манифест (или index.pkl) векторного хранилища.
+
+    meta.json хранилища memory-map содержит отпечаток индекса FAISS, из которого оно сконвертировано.
+    """
+    if os.path.exists(CSV_FILE_PATH):
+        return CSV_FILE_PATH
+    if _use_mmap_store():
+        return os.path.join(MMAP_STORE_PATH, "meta.json")
+    manifest_path = os.path.join(INDEX_LOAD_PATH, "manifest.json")
+    return manifest_path if os.path.exists(manifest_path) else os.path.join(INDEX_LOAD_PATH, "index.pkl")
+
+@functools.lru_cache(maxsize=1)
+def get_neighbour_table():
+    """Таблица ближайших событий для дат календаря (кэшируется); пересобирается, если изменились данные.
+
+    Возвращает None, если таблица отключена или её не удалось построить: тогда поиск идёт по индексу дат.
+    """
+    if not USE_NEIGHBOUR_TABLE:
+        return None
+    try:
+        return load_or_build_table(NEIGHBOUR_TABLE_PATH, get_date_index(), file_fingerprint(date_index_source()))
+    except Exception as e:
+        print(f"Таблица соседей недоступна, поиск по индексу дат: {e}")
+        return None
+
+def get_filter_options():
+    """Значения для фильтров интерфейса: места, категории и диапазон лет корпуса."""
+    metadata_index = get_date_metadata_index()
+    return {
+        "locations": metadata_index.locations,
+        "categories": metadata_index.categories,
+        "year_bounds": metadata_index.year_bounds,
+    }
+
+def retrieve_events(target_date: str, k: int = 5, window_days=None, year_range=None, locations=None, categories=None):
+    """Находит k событий, ближайших к дате; семантический поиск используется как запасной вариант.
+
+    year_range (первый, последний год), locations и categories ограничивают набор событий.
+    """
+    allowed = get_date_metadata_index().candidates(year_range, locations, categories)
+    if allowed is not None and not allowed:
+        # Под фильтры не подходит ни одно событие: семантический поиск тоже ничего не найдёт
+        print("Под выбранные фильтры не подходит ни одно событие.")
+        return []
+    parsed = parse_date(target_date)
+    if parsed is not None:
+        date_index = get_date_index()
+        table = get_neighbour_table()
+        # Для дат календаря ответ уже посчитан — срез строки таблицы; иначе бинарный поиск по индексу дат
+        positions = table.lookup(parsed, k, window_days, allowed) if table is not None else None
+        if positions is not None:
+            docs = [date_index.documents[position] for position in positions]
+        else:
+            docs = date_index.search(parsed, k=k, window_days=window_days, allowed=allowed)
+        if docs:
+            return docs
+        print(f"В индексе дат нет событий около '{target_date}', переходим к семантическому поиску.")
+    else:
+        print(f"Дата '{target_date}' не распознана, используем семантический поиск.")
+    return semantic_search(target_date, k=k, year_range=year_range, locations=locations, categories=categories)
+
+def semantic_search(target_date: str, k: int = 5, year_range=None, locations=None, categories=None):
+    """Семантический поиск событий по дате; для дат календаря используется предвычисленный вектор запроса."""
+    parsed = parse_date(target_date)
+    vectors = get_query_vectors()
+    if parsed is not None and vectors is not None and CALENDAR_START <= parsed <= CALENDAR_END:
+        vector_store = get_vector_store()
+        if vector_store is None:
+            raise RuntimeError("Векторное хранилище для RAG не инициализировано.")
+        query_vector = np.asarray(vectors[(parsed - CALENDAR_START).days], dtype=np.float32)
+        candidate_ids = get_vector_metadata_index().candidates(year_range, locations, categories)
+        if candidate_ids is not None:
+            return similarity_search_by_vector_filtered(vector_store, query_vector, k, candidate_ids)
+        return vector_store.similarity_search_by_vector(query_vector.tolist(), k=k)
+    # Свободный текст или дата вне календаря — нужен настоящий эмбеддинг (модель загрузится лениво)
+    retriever = get_retriever(k=k, year_range=year_range, locations=locations, categories=categories)
+    return retriever.invoke(semantic_query(target_date))
+
+def retrieve_events_many(target_dates, k: int = 5, window_days=None, year_range=None, locations=None, categories=None):
+    """Пакетный вариант retrieve_events: все даты обрабатываются одним проходом по индексу дат."""
+    allowed = get_date_metadata_index().candidates(year_range, locations, categories)
+    if allowed is not None and not allowed:
+        return [[] for _ in target_dates]
+    results = get_date_index().search_many(target_dates, k=k, window_days=window_days, allowed=allowed)
+    for i, docs in enumerate(results):
+        if not docs:
+            # Для дат без событий в окне (или нераспознанных) — тот же запасной путь, что и в retrieve_events
+            results[i] = retrieve_events(target_dates[i], k=k, window_days=window_days, year_range=year_range,
+                                         locations=locations, categories=categories)
+    return results
+
 # --- Блок для локального тестирования RAG ---
 if __name__ == '__main__':
     print("Запуск локального теста RAG модуля (с загрузкой индекса)...")
@@ -92,6 +358,11 @@ if __name__ == '__main__':
         else:
             print("Не удалось создать ретривер (вероятно, индекс не загрузился).")
 
+        date_query = "7 сентября 1812"
+        print(f"\nБлижайшие по дате события для '{date_query}':")
+        for doc, distance in get_date_index().search_with_distance(date_query, k=3):
+            print(f"- [{distance} дн.] {doc.page_content}")
+
     except RuntimeError as rte:
         print(f"Ошибка выполнения при тесте RAG: {rte}")
     except Exception as e:
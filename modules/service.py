@@ -0,0 +1,235 @@
+# modules/service.py
+"""HTTP-сервис генерации без Streamlit: минимальное ASGI-приложение с JSON-эндпоинтами.
+
+    POST /generate  — выпуск на дату: {"date": "7 September 1812", "era_style": "XIX", "num_articles": 3, ...}
+    POST /retrieve  — события для даты: {"date": "7 September 1812", "k": 5, "semantic": false, ...}
+    GET  /healthz   — готовность воркера
+    GET  /metrics   — метрики в текстовом формате Prometheus
+
+Один процесс: python -m modules.service --port 8000
+Несколько воркеров с общими индексами (pre-fork, copy-on-write):
+    NEWS_SERVICE_PRELOAD=1 gunicorn modules.service:app -k uvicorn.workers.UvicornWorker -w 4 --preload
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+
+from pydantic import BaseModel, Field, ValidationError
+
+from . import generator
+from .prompt_budget import load_tokenizer
+from .rag import (get_date_index, get_date_metadata_index, get_neighbour_table, get_query_vectors, get_vector_metadata_index,
+                  get_vector_store, retrieve_events, semantic_search)
+from .telemetry import get_metrics
+
+# Предельный размер тела запроса
+MAX_BODY_BYTES = 64 * 1024
+
+
+class GenerateRequest(BaseModel):
+    date: str
+    era_style: str = "XIX"
+    num_articles: int = Field(3, ge=1, le=10)
+    date_window_days: Optional[int] = Field(None, ge=0)
+    use_cache: bool = True
+    year_range: Optional[Tuple[int, int]] = None
+    locations: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+
+
+class RetrieveRequest(BaseModel):
+    date: str
+    k: int = Field(5, ge=1, le=50)
+    window_days: Optional[int] = Field(None, ge=0)
+    semantic: bool = False
+    year_range: Optional[Tuple[int, int]] = None
+    locations: Optional[List[str]] = None
+    categories: Optional[List[str]] = None
+
+
+class _BodyTooLarge(Exception):
+    pass
+
+
+_preload_stats = None
+
+
+def preload() -> dict:
+    """Загружает индексы в память процесса (повторный вызов ничего не делает).
+
+    В pre-fork модели (gunicorn --preload) вызывается в мастере до fork: воркеры получают индексы
+    готовыми и делят их страницы copy-on-write. Клиент LLM здесь не создаётся — сокеты и пулы
+    соединений не должны переживать fork, каждый воркер откроет свои при первом запросе.
+    """
+    global _preload_stats
+    if _preload_stats is not None:
+        return _preload_stats
+    started = time.perf_counter()
+    date_index = get_date_index()
+    get_date_metadata_index()
+    # Таблица соседей открывается через memory-map (при устаревших данных — пересобирается)
+    neighbour_table = get_neighbour_table()
+    # Токенизатор — только из локального кэша tiktoken, чтобы первый запрос не ждал сети
+    tokenizer = load_tokenizer()
+    vector_documents = None
+    try:
+        vector_store = get_vector_store()
+        get_vector_metadata_index()
+        get_query_vectors()
+        vector_documents = vector_store.index.ntotal if hasattr(vector_store, "index") else len(vector_store)
+    except RuntimeError as e:
+        # Без векторной базы сервис работает на индексе дат, семантический поиск будет отвечать ошибкой
+        print(f"Векторное хранилище не загружено: {e}")
+    # Загруженные объекты больше не трогает сборщик мусора: иначе он пишет в их заголовки
+    # и воркеры постепенно копируют себе «общие» страницы памяти
+    gc.freeze()
+    _preload_stats = {
+        "date_index_documents": len(date_index),
+        "vector_store_documents": vector_documents,
+        "neighbour_table": neighbour_table is not None,
+        "tokenizer": "tiktoken" if tokenizer is not None else "chars",
+        "preload_seconds": round(time.perf_counter() - started, 3),
+    }
+    print(f"Индексы загружены: {_preload_stats}")
+    return _preload_stats
+
+
+# --- Обработчики ---
+async def handle_generate(body: bytes):
+    request = GenerateRequest.model_validate_json(body or b"{}")
+    result = await generator.agenerate_news(
+        request.date, era_style=request.era_style, num_articles=request.num_articles,
+        date_window_days=request.date_window_days, use_cache=request.use_cache,
+        year_range=request.year_range, locations=request.locations, categories=request.categories,
+    )
+    # 200 — выпуск готов, 404 — для даты нет событий, 500 — ошибка поиска или LLM
+    status = 200 if result.ok else (500 if result.error_message else 404)
+    return status, result.to_dict()
+
+
+async def handle_retrieve(body: bytes):
+    request = RetrieveRequest.model_validate_json(body or b"{}")
+    filters = {"year_range": request.year_range, "locations": request.locations, "categories": request.categories}
+    if request.semantic:
+        docs = await asyncio.to_thread(semantic_search, request.date, request.k, **filters)
+    else:
+        docs = await asyncio.to_thread(retrieve_events, request.date, request.k, request.window_days, **filters)
+    return 200, {
+        "date": request.date,
+        "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in docs],
+    }
+
+
+async def handle_healthz(body: bytes):
+    return 200, {"status": "ok", "pid": os.getpid(), **(_preload_stats or {})}
+
+
+async def handle_metrics(body: bytes):
+    return 200, get_metrics().render_prometheus()
+
+
+ROUTES = {
+    ("POST", "/generate"): handle_generate,
+    ("POST", "/retrieve"): handle_retrieve,
+    ("GET", "/healthz"): handle_healthz,
+    ("GET", "/metrics"): handle_metrics,
+}
+
+
+# --- ASGI ---
+async def _read_body(receive) -> bytes:
+    chunks, size = [], 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise _BodyTooLarge()
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_response(send, status: int, payload) -> None:
+    if isinstance(payload, str):
+        body = payload.encode("utf-8")
+        content_type = b"text/plain; version=0.0.4; charset=utf-8"
+    else:
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+        content_type = b"application/json; charset=utf-8"
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                # Если мастер уже загрузил индексы до fork, здесь ничего не грузится
+                await asyncio.to_thread(preload)
+            except Exception as e:
+                await send({"type": "lifespan.startup.failed", "message": str(e)})
+                return
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """ASGI-приложение (uvicorn, gunicorn с UvicornWorker, hypercorn)."""
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+    handler = ROUTES.get((scope["method"], scope["path"]))
+    if handler is None:
+        known_path = any(path == scope["path"] for _, path in ROUTES)
+        await _send_response(send, 405 if known_path else 404, {"error": "Метод не поддерживается." if known_path else "Не найдено."})
+        return
+    try:
+        status, payload = await handler(await _read_body(receive))
+    except _BodyTooLarge:
+        status, payload = 413, {"error": f"Тело запроса больше {MAX_BODY_BYTES} байт."}
+    except ValidationError as e:
+        status, payload = 422, {"error": "Некорректный запрос.", "details": json.loads(e.json(include_url=False))}
+    except Exception as e:
+        print(f"Ошибка обработки {scope['method']} {scope['path']}: {e}")
+        status, payload = 500, {"error": str(e)}
+    await _send_response(send, status, payload)
+
+
+# В pre-fork модели индексы грузятся при импорте в мастере (gunicorn --preload), до создания воркеров
+if os.getenv("NEWS_SERVICE_PRELOAD") == "1":
+    preload()
+
+
+def main(argv=None) -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="HTTP-сервис 'Исторического ВестникЪ' (без Streamlit).")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--base-url", default=None, help="Адрес OpenAI-совместимого API (например, локальной заглушки).")
+    args = parser.parse_args(argv)
+    if args.base_url:
+        generator.configure_llm(base_url=args.base_url)
+    # Один процесс; для нескольких воркеров с общими индексами — gunicorn --preload (см. докстринг модуля)
+    uvicorn.run(app, host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
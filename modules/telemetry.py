@@ -0,0 +1,234 @@
+# modules/telemetry.py
+"""Тайминги этапов генерации: трасса запроса из спанов, экспорт в JSONL и метрики в формате Prometheus.
+
+generate_news (и его асинхронный/потоковый варианты) записывает в Trace спаны поиска, кэша, рендера промпта,
+вызова LLM (с временем до первого токена и числом токенов), разбора, ручного извлечения JSON и пауз между
+попытками. Завершённая трасса попадает в общий реестр метрик (get_metrics().render_prometheus()) и,
+если задана переменная NEWS_TRACE_LOG, дописывается строкой в JSONL-файл.
+"""
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+# Путь к JSONL-журналу трасс; пустое значение — не писать
+TRACE_LOG_PATH = os.getenv("NEWS_TRACE_LOG", "")
+# Границы корзин гистограмм длительности (секунды): от поиска по дате до таймаута LLM
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+# Границы корзин размера контекста (символы)
+CONTEXT_BUCKETS = (250, 500, 1000, 2000, 4000, 8000, 16000, 32000)
+
+
+class Span:
+    """Один этап запроса: имя, смещение от начала трассы, длительность и произвольные атрибуты."""
+
+    __slots__ = ("name", "start", "duration", "attrs", "_started")
+
+    def __init__(self, name: str, start: float, attrs: dict):
+        self.name = name
+        self.start = start
+        self.duration = None
+        self.attrs = attrs
+        self._started = time.perf_counter()
+
+    def elapsed(self) -> float:
+        """Секунды с начала спана (например, для времени до первого токена)."""
+        return time.perf_counter() - self._started
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "start": round(self.start, 6), "duration": round(self.duration or 0.0, 6), **self.attrs}
+
+
+class Trace:
+    """Трасса одного запроса на генерацию. Спаны добавляются по завершении этапа.
+
+    operation можно не указывать: его подставит функция генерации, которой передана трасса.
+    """
+
+    def __init__(self, operation: Optional[str] = None, **attrs):
+        self.trace_id = uuid.uuid4().hex
+        self.operation = operation
+        self.attrs = dict(attrs)
+        self.spans: List[Span] = []
+        self.error: Optional[str] = None
+        self.outcome: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.started_at = time.time()
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def set(self, **attrs) -> None:
+        self.attrs.update(attrs)
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """Засекает этап; исключение помечает спан и трассу, но пробрасывается дальше."""
+        span = Span(name, time.perf_counter() - self._t0, attrs)
+        try:
+            yield span
+        except BaseException as e:
+            span.attrs["error"] = type(e).__name__
+            self.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            span.duration = span.elapsed()
+            with self._lock:
+                self.spans.append(span)
+
+    def finish(self, outcome: str) -> None:
+        """Закрывает трассу: учитывает её в метриках и пишет в журнал. Повторный вызов ничего не делает."""
+        with self._lock:
+            if self.duration is not None:
+                return
+            self.duration = time.perf_counter() - self._t0
+            self.outcome = outcome
+        get_metrics().observe_trace(self)
+        if TRACE_LOG_PATH:
+            try:
+                append_jsonl(TRACE_LOG_PATH, self.to_dict())
+            except OSError as e:
+                print(f"Не удалось записать трассу в '{TRACE_LOG_PATH}': {e}")
+
+    def stage_totals(self) -> Dict[str, float]:
+        """Суммарное время по этапам (этап мог повторяться на нескольких попытках)."""
+        totals = defaultdict(float)
+        for span in self.spans:
+            totals[span.name] += span.duration or 0.0
+        return dict(totals)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "operation": self.operation,
+            "started_at": self.started_at,
+            "duration": round(self.duration, 6) if self.duration is not None else None,
+            "outcome": self.outcome,
+            "error": self.error,
+            **self.attrs,
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+
+_jsonl_lock = threading.Lock()
+
+
+def append_jsonl(path: str, record: dict) -> None:
+    """Дописывает запись в JSONL; строки от разных потоков не перемешиваются."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _jsonl_lock, open(path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels) + "}"
+
+
+class MetricsRegistry:
+    """Потокобезопасные счётчики и гистограммы процесса с выводом в текстовом формате Prometheus."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[tuple, float]] = defaultdict(lambda: defaultdict(float))
+        # имя -> (границы корзин, метки -> [счётчики корзин..., +Inf, сумма])
+        self._histograms: Dict[str, Tuple[tuple, Dict[tuple, list]]] = {}
+        self._help: Dict[str, str] = {}
+
+    def inc(self, name: str, value: float = 1.0, help_text: str = "", **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            self._counters[name][key] += value
+
+    def observe(self, name: str, value: float, buckets: tuple = DURATION_BUCKETS, help_text: str = "", **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._help.setdefault(name, help_text)
+            bounds, series = self._histograms.setdefault(name, (buckets, {}))
+            counts = series.setdefault(key, [0] * (len(bounds) + 1) + [0.0])
+            counts[bisect.bisect_left(bounds, value)] += 1
+            counts[-1] += value
+
+    def observe_trace(self, trace: Trace) -> None:
+        """Переводит завершённую трассу в метрики."""
+        self.inc("news_requests_total", help_text="Запросы на генерацию по исходу.",
+                 operation=trace.operation, outcome=trace.outcome or "unknown")
+        self.observe("news_request_duration_seconds", trace.duration or 0.0,
+                     help_text="Полное время запроса на генерацию.", operation=trace.operation)
+        if trace.attrs.get("attempts"):
+            self.inc("news_llm_attempts_total", trace.attrs["attempts"], help_text="Попытки запроса к LLM (включая повторные).")
+        if trace.attrs.get("context_chars") is not None:
+            self.observe("news_context_chars", trace.attrs["context_chars"], buckets=CONTEXT_BUCKETS,
+                         help_text="Размер контекста RAG в символах.")
+        if trace.attrs.get("prompt_tokens_saved"):
+            self.inc("news_prompt_tokens_saved_total", trace.attrs["prompt_tokens_saved"],
+                     help_text="Входные токены, сэкономленные бюджетом промпта (дубли, обрезка, компактная схема).")
+        for span in trace.spans:
+            self.observe("news_stage_duration_seconds", span.duration or 0.0,
+                         help_text="Длительность этапов генерации.", stage=span.name)
+            if "ttft" in span.attrs:
+                self.observe("news_llm_time_to_first_token_seconds", span.attrs["ttft"],
+                             help_text="Время от отправки запроса до первого токена LLM.")
+            for kind in ("prompt", "completion"):
+                tokens = span.attrs.get(f"{kind}_tokens")
+                if tokens:
+                    self.inc("news_llm_tokens_total", tokens, help_text="Токены LLM по типу.", kind=kind)
+
+    def snapshot(self) -> dict:
+        """Текущие значения в виде словаря (для отладочной панели и тестов)."""
+        with self._lock:
+            counters = {name: {_format_labels(k): v for k, v in series.items()} for name, series in self._counters.items()}
+            histograms = {
+                name: {_format_labels(k): {"count": sum(c[:-1]), "sum": c[-1]} for k, c in series.items()}
+                for name, (_, series) in self._histograms.items()
+            }
+        return {"counters": counters, "histograms": histograms}
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат экспозиции Prometheus (для /metrics или записи в файл node_exporter)."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in sorted(series.items()):
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+            for name, (bounds, series) in sorted(self._histograms.items()):
+                if self._help.get(name):
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, counts in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(list(bounds) + ["+Inf"], counts[:-1]):
+                        cumulative += count
+                        le = bound if bound == "+Inf" else f"{bound:g}"
+                        lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {counts[-1]:g}")
+                    lines.append(f"{name}_count{_format_labels(key)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+
+@functools.lru_cache(maxsize=1)
+def get_metrics() -> MetricsRegistry:
+    """Возвращает общий реестр метрик процесса."""
+    return MetricsRegistry()
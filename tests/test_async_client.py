@@ -0,0 +1,65 @@
+# tests/test_async_client.py
+"""Асинхронный клиент LLM и циклы событий: каждый asyncio.run должен работать с настоящим ChatOpenAI."""
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from modules import generator
+from modules.bench import canned_report
+from modules.cache import NewsCache
+
+
+class StubOpenAIHandler(BaseHTTPRequestHandler):
+    """OpenAI-совместимый /chat/completions: потоковый ответ с готовым выпуском, соединение keep-alive."""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        content = json.dumps(canned_report(3), ensure_ascii=False)
+        chunks = [content[i:i + 64] for i in range(0, len(content), 64)]
+        events = [{"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": request["model"],
+                   "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]} for chunk in chunks]
+        events.append({"id": "stub", "object": "chat.completion.chunk", "created": 0, "model": request["model"],
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+        body = "".join(f"data: {json.dumps(event, ensure_ascii=False)}\n\n" for event in events) + "data: [DONE]\n\n"
+        payload = body.encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.requests += 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_api(tmp_path, monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubOpenAIHandler)
+    server.requests = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    news_cache = NewsCache(str(tmp_path / "news_cache.sqlite3"))
+    monkeypatch.setattr(generator, "get_news_cache", lambda: news_cache)
+    monkeypatch.setattr(generator, "API_KEY", "test")
+    generator._llm_override = None
+    generator.configure_llm(base_url=f"http://127.0.0.1:{server.server_port}/v1")
+    yield server
+    server.shutdown()
+    server.server_close()
+    generator.configure_llm()
+
+
+def test_agenerate_news_survives_several_event_loops(stub_api):
+    # Каждый asyncio.run создаёт и закрывает свой цикл событий; клиент прошлого цикла использовать нельзя
+    results = [asyncio.run(generator.agenerate_news("7 September 1812", num_articles=3, use_cache=False))
+               for _ in range(3)]
+
+    assert [result.error_message for result in results] == [None, None, None]
+    assert all(len(result.articles) == 3 for result in results)
+    assert stub_api.requests == 3
@@ -0,0 +1,34 @@
+# tests/test_batch.py
+"""Пакетная генерация: сводка прогона считает только задачи этого прогона."""
+import datetime
+import json
+
+import pytest
+
+from modules import batch, generator
+from modules.bench import FakeNewsLLM
+from modules.cache import NewsCache
+
+
+@pytest.fixture
+def fake_llm(tmp_path, monkeypatch):
+    news_cache = NewsCache(str(tmp_path / "news_cache.sqlite3"))
+    monkeypatch.setattr(generator, "get_news_cache", lambda: news_cache)
+    generator.configure_llm(llm=FakeNewsLLM(ttft=0.0, tokens_per_second=0.0))
+    yield
+    generator._llm_override = None
+    generator.configure_llm()
+
+
+def test_skipped_counts_only_this_runs_tasks(tmp_path, fake_llm):
+    output_path = str(tmp_path / "calendar.jsonl")
+    with open(output_path, "w", encoding="utf-8") as f:
+        # Готовый выпуск из диапазона прогона и два выпуска вне его
+        for day, era in (("1812-09-07", "XIX"), ("1812-01-01", "XIX"), ("1812-09-07", "XX")):
+            f.write(json.dumps({"date": day, "era": era, "num_articles": 3, "articles": []}) + "\n")
+
+    stats = batch.run_batch(datetime.date(1812, 9, 7), datetime.date(1812, 9, 8), ["XIX"], output_path,
+                            workers=1, rate=0)
+
+    assert stats["skipped"] == 1
+    assert stats["done"] == 1 and stats["failed"] == 0
@@ -0,0 +1,64 @@
+# tests/test_mmap_store.py
+"""Хранилище memory-map и индекс FAISS: устаревшее после сборки индекса хранилище не должно читаться молча."""
+import json
+import os
+import shutil
+
+import pytest
+
+from modules import mmap_store, rag
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    faiss_dir = str(tmp_path / "faiss_index")
+    mmap_dir = str(tmp_path / "vector_store_mmap")
+    os.makedirs(faiss_dir)
+    for name in ("index.faiss", "index.pkl"):
+        shutil.copy(os.path.join(rag.INDEX_LOAD_PATH, name), faiss_dir)
+    mmap_store.convert_faiss_dir(faiss_dir, mmap_dir)
+    monkeypatch.setattr(rag, "INDEX_LOAD_PATH", faiss_dir)
+    monkeypatch.setattr(rag, "MMAP_STORE_PATH", mmap_dir)
+    monkeypatch.setattr(rag, "VECTOR_STORE_FORMAT", "auto")
+    # Без CSV индекс дат (и таблица соседей) строится по векторному хранилищу
+    monkeypatch.setattr(rag, "CSV_FILE_PATH", str(tmp_path / "missing.csv"))
+    rag._use_mmap_store.cache_clear()
+    yield faiss_dir, mmap_dir
+    rag._use_mmap_store.cache_clear()
+
+
+def write_manifest(faiss_dir: str, rows: dict) -> None:
+    # Так манифест меняет каждая сборка python -m modules.index_builder
+    with open(os.path.join(faiss_dir, mmap_store.FAISS_MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump({"version": 1, "rows": rows}, f)
+
+
+def test_fresh_conversion_is_used(stores):
+    faiss_dir, mmap_dir = stores
+    assert not mmap_store.is_stale(mmap_dir, faiss_dir)
+    assert rag._use_mmap_store()
+    assert rag.date_index_source() == os.path.join(mmap_dir, "meta.json")
+
+
+def test_rebuilt_faiss_index_makes_mmap_store_stale(stores):
+    faiss_dir, mmap_dir = stores
+    write_manifest(faiss_dir, {"a": {"id": 0}})
+    assert mmap_store.is_stale(mmap_dir, faiss_dir)
+    # В режиме auto читается FAISS, а таблица соседей сверяется с его манифестом
+    assert not rag._use_mmap_store()
+    assert rag.date_index_source() == os.path.join(faiss_dir, "manifest.json")
+
+    # После повторной конвертации отпечаток в meta.json снова совпадает и меняется вместе с индексом
+    with open(os.path.join(mmap_dir, "meta.json"), encoding="utf-8") as f:
+        old_fingerprint = json.load(f)["source_fingerprint"]
+    mmap_store.convert_faiss_dir(faiss_dir, mmap_dir)
+    with open(os.path.join(mmap_dir, "meta.json"), encoding="utf-8") as f:
+        assert json.load(f)["source_fingerprint"] != old_fingerprint
+    assert not mmap_store.is_stale(mmap_dir, faiss_dir)
+
+
+def test_explicit_mmap_format_is_kept_when_stale(stores, monkeypatch):
+    faiss_dir, _ = stores
+    write_manifest(faiss_dir, {"b": {"id": 1}})
+    monkeypatch.setattr(rag, "VECTOR_STORE_FORMAT", "mmap")
+    assert rag._use_mmap_store()
@@ -0,0 +1,144 @@
+# tests/test_parse_recovery.py
+"""Восстановление испорченных ответов LLM: оборванный JSON не должен приниматься и кэшироваться как полный выпуск."""
+import asyncio
+import json
+
+import pytest
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+from modules import generator
+from modules.bench import FakeNewsLLM, canned_report
+from modules.cache import NewsCache
+
+CONTEXT = "1812-09-07 — Бородинское сражение (Бородино, Россия; Война)"
+REPORTER = canned_report(1)["articles"][0]["reporter"]
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    news_cache = NewsCache(str(tmp_path / "news_cache.sqlite3"))
+    monkeypatch.setattr(generator, "get_news_cache", lambda: news_cache)
+    monkeypatch.setattr(generator, "RETRY_BACKOFF_SECONDS", 0)
+    yield news_cache
+    generator._llm_override = None
+    generator.configure_llm()
+
+
+class DroppedStreamLLM(FakeNewsLLM):
+    """Заглушка, у которой первый поток обрывается сетевой ошибкой после двух статей."""
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        chunks = list(super()._stream(messages, stop, run_manager, **kwargs))
+        if self.calls > 1:
+            yield from chunks
+            return
+        text = "".join(chunk.message.content for chunk in chunks)
+        # Отдаём ответ до конца второй статьи и рвём соединение
+        second_end = text.index("}", text.index('"reporter"', text.index('"reporter"') + 1)) + 1
+        yield ChatGenerationChunk(message=AIMessageChunk(content=text[:second_end]))
+        raise ConnectionError("соединение сброшено")
+
+
+class ShortReplyLLM(FakeNewsLLM):
+    """Заглушка, которая отвечает цельным JSON, но с одной статьёй вместо запрошенных."""
+
+    def _next_response(self, messages):
+        text = json.loads(super()._next_response(messages))
+        return json.dumps({"articles": text["articles"][:1]}, ensure_ascii=False)
+
+
+def use_llm(llm_class=FakeNewsLLM, **kwargs) -> FakeNewsLLM:
+    llm = llm_class(ttft=0.0, tokens_per_second=0.0, **kwargs)
+    generator.configure_llm(llm=llm)
+    return llm
+
+
+def test_truncated_reply_is_repaired_with_topup(cache):
+    llm = use_llm(script=("truncated", None))
+    result = generator.generate_news_with_context("7 September 1812", CONTEXT, num_articles=3)
+
+    assert result.ok and result.repaired
+    assert len(result.articles) == 3
+    assert all(article.reporter == REPORTER for article in result.articles)
+    assert result.complete and result.missing_articles == 0
+    assert llm.calls == 2 # исходный запрос + дозапрос недостающих статей
+    assert cache.stats()["size"] == 1
+
+
+def test_truncated_replies_are_never_cached(cache):
+    use_llm(malformed_rate=1.0, malformed_kinds=("truncated",))
+    result = generator.generate_news_with_context("7 September 1812", CONTEXT, num_articles=3)
+
+    # Обрезанная статья не попадает в выпуск, неполный выпуск — в кэш
+    assert all(article.reporter == REPORTER for article in result.articles)
+    assert len(result.articles) < 3
+    assert result.missing_articles == 3 - len(result.articles) and not result.complete
+    assert cache.stats()["size"] == 0
+
+    use_llm()
+    clean = generator.generate_news_with_context("7 September 1812", CONTEXT, num_articles=3)
+    assert not clean.cache_hit
+    assert len(clean.articles) == 3
+
+
+def test_async_truncated_reply_is_repaired(cache):
+    llm = use_llm(script=("truncated", None))
+    result = asyncio.run(generator.agenerate_news("7 September 1812", num_articles=3))
+
+    assert result.ok and result.repaired
+    assert len(result.articles) == 3
+    assert all(article.reporter == REPORTER for article in result.articles)
+    assert llm.calls == 2
+
+
+def test_truncated_stream_is_topped_up(cache):
+    llm = use_llm(script=("truncated", None))
+    stream = generator.stream_news("7 September 1812", num_articles=3)
+    articles = list(stream)
+    result = stream.result
+
+    # Статьи дозапроса тоже отдаются потоком, и итог совпадает с тем, что увидел пользователь
+    assert len(articles) == 3 and result.articles == articles
+    assert result.repaired and result.complete
+    assert llm.calls == 2
+    assert cache.stats()["size"] == 1
+
+
+def test_stream_topup_failure_is_reported(cache):
+    use_llm(malformed_rate=1.0, malformed_kinds=("truncated",))
+    stream = generator.stream_news("7 September 1812", num_articles=3)
+    articles = list(stream)
+    result = stream.result
+
+    assert result.ok and not result.complete
+    assert result.missing_articles == 3 - len(articles)
+    assert any("восстановлен частично" in warning for warning in result.warnings)
+    assert cache.stats()["size"] == 0
+
+
+def test_dropped_stream_is_a_partial_result_not_a_hidden_error(cache):
+    llm = use_llm(DroppedStreamLLM)
+    stream = generator.stream_news("7 September 1812", num_articles=3)
+    articles = list(stream)
+    result = stream.result
+
+    # Ошибка после уже показанных статей не прячется в error_message: UI видит только предупреждения
+    assert result.error_message is None
+    assert any("прервался" in warning for warning in result.warnings)
+    assert len(articles) == 3 and result.complete
+    assert llm.calls == 2
+
+
+def test_shorter_complete_reply_is_accepted_without_topup(cache):
+    llm = use_llm(ShortReplyLLM)
+    result = generator.generate_news_with_context("7 September 1812", CONTEXT, num_articles=3)
+
+    # Промпт просит «примерно» N статей: цельный короткий ответ — не повод для платного дозапроса
+    assert len(result.articles) == 1 and result.complete and not result.repaired
+    assert llm.calls == 1
+    assert cache.stats()["size"] == 1
+
+    stream = generator.stream_news("7 September 1812", num_articles=3, use_cache=False)
+    assert len(list(stream)) == 1 and stream.result.complete
+    assert llm.calls == 2